@@ -6,13 +6,17 @@ Backend for student onboarding system with local AI
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from pathlib import Path
 import uvicorn
+import asyncio
 import os
 import requests
 import shutil
+import json
 import time
 import logging
 import uuid
@@ -26,6 +30,8 @@ from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 
 from llm_agent import LocalLLMAgent
+from ollama_client import ollama_instance
+from tenant_registry import UnknownTenantError
 from document_processor import DocumentProcessor
 from roommate_matcher import RoommateMatcher
 from matcher import find_matches
@@ -89,11 +95,19 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"⚠️ Warmup failed: {e}")
 
+    # Pick up knowledge base edits without a restart
+    llm_agent.tenants.start_watchers()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    llm_agent.tenants.close()
+
 # Pydantic models for request/response
 class ChatRequest(BaseModel):
     message: str
     student_id: Optional[str] = "demo_student"
     language: Optional[str] = "en"
+    tenant_id: Optional[str] = None  # campus whose knowledge base answers; default campus if unset
 
 class ChatResponse(BaseModel):
     response: str
@@ -102,9 +116,29 @@ class ChatResponse(BaseModel):
     sources: Optional[List[str]] = []
     intent: Optional[str] = None
     latency: Optional[float] = None
+    index_version: Optional[int] = None
+    cached: bool = False
     fallback: Optional[bool] = False
     admin_escalation: bool = False
 
+class KnowledgeItem(BaseModel):
+    text: str
+    category: str = "general"
+    source: Optional[str] = "admin"
+
+class KnowledgeBatch(BaseModel):
+    items: List[KnowledgeItem]
+    tenant_id: Optional[str] = None
+
+class IndexBuildRequest(BaseModel):
+    chunk_tokens: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+    activate: bool = False
+
+class ABTestRequest(BaseModel):
+    version: int
+    share: float = 0.5
+
 class ChatFeedback(BaseModel):
     student_id: str
     message_id: str
@@ -336,16 +370,10 @@ async def generate_id_card(request: dict):
             f"No quotes, no explanation, just the tagline.\n\n{prompt_context}"
         )
 
-        import httpx
-        llama_resp = httpx.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "llama3.2", "prompt": llama_prompt, "stream": False},
-            timeout=15.0,
-        )
-        if llama_resp.status_code == 200:
-            raw = llama_resp.json().get("response", "").strip()
-            # Keep only the first sentence, strip quotes
-            ai_tagline = raw.split("\n")[0].strip('"\' ').rstrip('.')
+        llama_resp = await ollama_instance.agenerate(llama_prompt, caller="tagline")
+        raw = llama_resp.get("response", "").strip()
+        # Keep only the first sentence, strip quotes
+        ai_tagline = raw.split("\n")[0].strip('"\' ').rstrip('.')
     except Exception:
         # Ollama unavailable — silently fall back to empty tagline
         ai_tagline = ""
@@ -411,7 +439,13 @@ async def health_check():
     return {
         "status": "healthy" if ollama_health["ollama"] == "online" else "degraded",
         "ollama": ollama_health,
+        "rag_ready": rag_stats["dense_ready"],
         "rag": rag_stats,
+        "tenants": llm_agent.tenants.get_stats(),
+        "llm": llm_agent.llm.stats(),
+        "llm_cache": llm_agent.response_cache.stats(),
+        "semantic_cache": llm_agent.semantic_cache.stats(),
+        "inflight": llm_agent.inflight.stats(),
         "sessions": {
             "active": llm_agent.sessions.get_active_sessions(),
             "feedback": llm_agent.sessions.get_feedback_stats(),
@@ -429,32 +463,23 @@ async def chat(request: ChatRequest):
     logger.info(f"📨 Query from {request.student_id}: {request.message}")
 
     try:
-        # 1. Get student context
-        student = db.get_student(request.student_id)
-        context = {
-            "name": student.get("name", "Student") if student else "Student",
-            "progress": student.get("progress", 0) if student else 0,
-            "department": student.get("department", "Unknown") if student else "Unknown",
-            "year": "First Year", # Default for demo
-        }
-        logger.info(f"👤 Context loaded for {context['name']} ({context['department']})")
-
-        # 2. Select language
-        language = request.language or "en"
-        if language == "auto":
-            language = llm_agent.detect_language(request.message)
+        # 1. Get student context, 2. Select language
+        context, language = _chat_context(request)
 
         # 3. Step-by-step RAG Pipeline Logging
         # Perform retrieval again here just for logging visibility if needed,
         # or rely on agent internal logging. We'll do it in the agent for simplicity but log the triggers here.
         logger.info(f"🔍 Searching knowledge base for: {request.message}")
 
-        # 4. Get Response
-        result = llm_agent.chat(
+        # 4. Get Response (off the event loop, so concurrent chats overlap and
+        # their query encodes can share a micro-batch)
+        result = await run_in_threadpool(
+            llm_agent.chat,
             message=request.message,
             student_id=request.student_id,
             context=context,
             language=language,
+            tenant_id=request.tenant_id,
         )
 
         latency = round(time.time() - start_time, 2)
@@ -470,20 +495,100 @@ async def chat(request: ChatRequest):
             intent=result.get("intent"),
             latency=latency,
             fallback=result.get("fallback", False),
-            admin_escalation=result.get("admin_escalation", False)
+            admin_escalation=result.get("admin_escalation", False),
+            index_version=result.get("index_version"),
+            cached=result.get("cached", False),
         )
 
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Unknown campus: {request.tenant_id}")
     except Exception as e:
         logger.error(f"❌ Chat Error: {e}")
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
 
+def _chat_context(request: ChatRequest):
+    """Student context for the prompt and the response language of a chat request."""
+    student = db.get_student(request.student_id)
+    context = {
+        "name": student.get("name", "Student") if student else "Student",
+        "progress": student.get("progress", 0) if student else 0,
+        "department": student.get("department", "Unknown") if student else "Unknown",
+        "year": "First Year", # Default for demo
+    }
+    logger.info(f"👤 Context loaded for {context['name']} ({context['department']})")
+
+    language = request.language or "en"
+    if language == "auto":
+        language = llm_agent.detect_language(request.message)
+    return context, language
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Chat with token streaming over Server-Sent Events: a `token` event per
+    generated token, then one `done` event with the final response, message id,
+    sources, time-to-first-token and latency (the session is saved at that point).
+    """
+    start_time = time.time()
+    logger.info(f"📨 Streaming query from {request.student_id}: {request.message}")
+    if request.tenant_id:
+        await _tenant_rag(request.tenant_id)  # unknown campus: 404 before the stream starts
+    context, language = _chat_context(request)
+
+    def events():
+        try:
+            for event in llm_agent.chat_stream(
+                message=request.message,
+                student_id=request.student_id,
+                context=context,
+                language=language,
+                tenant_id=request.tenant_id,
+            ):
+                name = event.pop("event")
+                if name == "done":
+                    latency = round(time.time() - start_time, 2)
+                    llm_agent.sessions.add_latency(request.student_id, latency)
+                    event["latency"] = latency
+                    logger.info(f"⚡ Streamed in {latency}s (first token {event['ttft']}s) | "
+                                f"Intent: {event['intent']} | Sources: {event['sources']}")
+                yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"❌ Chat Stream Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    # A sync generator is iterated in the threadpool, so the blocking Ollama stream
+    # never holds up the event loop
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _tenant_rag(tenant_id: Optional[str]):
+    """
+    RAG engine of a campus (loaded on demand, off the event loop: a first load
+    chunks and indexes the knowledge base); 404 for campuses without one.
+    """
+    try:
+        return await run_in_threadpool(llm_agent.tenants.get, tenant_id)
+    except UnknownTenantError:
+        raise HTTPException(status_code=404, detail=f"Unknown campus: {tenant_id}")
+
+
 @app.get("/api/test-rag")
-async def test_rag(query: str = "What documents do I need?"):
-    """Benchmarking endpoint to test RAG retrieval quality."""
-    chunks = llm_agent.rag.search(query, top_k=3)
+async def test_rag(query: str = "What documents do I need?", mode: Optional[str] = None,
+                   version: Optional[int] = None, tenant_id: Optional[str] = None):
+    """Benchmarking endpoint to test RAG retrieval quality (mode: dense, keyword or hybrid; any stored version)."""
+    rag = await _tenant_rag(tenant_id)
+    try:
+        chunks = rag.search(query, top_k=3, mode=mode, version=version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return {
         "query": query,
+        "tenant": tenant_id or llm_agent.tenants.default_tenant,
+        "mode": mode or rag.search_mode,
+        "version": version or rag.active_version,
         "results_count": len(chunks),
         "matches": [
             {
@@ -495,6 +600,93 @@ async def test_rag(query: str = "What documents do I need?"):
     }
 
 
+@app.post("/api/admin/knowledge")
+async def add_knowledge(batch: KnowledgeBatch):
+    """Push a batch of announcements into the knowledge base (one encode, one write)."""
+    items = [item.dict() for item in batch.items]
+    rag = await _tenant_rag(batch.tenant_id)
+    result = await run_in_threadpool(rag.add_documents, items)
+    if not result["success"]:
+        raise HTTPException(status_code=503, detail="Knowledge base is not ready yet")
+    logger.info(f"📚 Knowledge batch: {result['added']} added, {result['duplicates']} duplicates")
+    return result
+
+
+@app.get("/api/admin/index/versions")
+async def list_index_versions(tenant_id: Optional[str] = None):
+    """Stored index snapshots, the active one and any running A/B test."""
+    rag = await _tenant_rag(tenant_id)
+    return {"active": rag.active_version, "pinned": rag.pinned, "ab_test": rag.ab_test,
+            "versions": rag.list_versions()}
+
+
+@app.post("/api/admin/index/build")
+async def build_index_version(request: IndexBuildRequest, tenant_id: Optional[str] = None):
+    """Build a new snapshot (e.g. with different chunking) beside the active one."""
+    rag = await _tenant_rag(tenant_id)
+    version = await run_in_threadpool(rag.build_version, request.chunk_tokens,
+                                      request.chunk_overlap, request.activate)
+    if version is None:
+        raise HTTPException(status_code=503, detail="Knowledge base is not ready yet")
+    logger.info(f"📚 Built index v{version}")
+    return {"version": version, "active": rag.active_version}
+
+
+@app.post("/api/admin/index/activate/{version}")
+async def activate_index_version(version: int, pin: bool = True, tenant_id: Optional[str] = None):
+    """Serve a stored snapshot; pinned versions are not rebuilt over by the watcher."""
+    rag = await _tenant_rag(tenant_id)
+    try:
+        await run_in_threadpool(rag.activate_version, version, pin)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    logger.info(f"🔀 Index v{version} activated")
+    return {"active": version, "pinned": pin}
+
+
+@app.post("/api/admin/index/rollback")
+async def rollback_index(tenant_id: Optional[str] = None):
+    """Pin the previous snapshot."""
+    rag = await _tenant_rag(tenant_id)
+    version = await run_in_threadpool(rag.rollback)
+    if version is None:
+        raise HTTPException(status_code=409, detail="No older index version to roll back to")
+    logger.info(f"⏪ Rolled back to index v{version}")
+    return {"active": version, "pinned": True}
+
+
+@app.post("/api/admin/index/unpin")
+async def unpin_index(tenant_id: Optional[str] = None):
+    """Resume automatic re-indexing after a rollback."""
+    rag = await _tenant_rag(tenant_id)
+    await run_in_threadpool(rag.unpin)
+    return {"active": rag.active_version, "pinned": False}
+
+
+@app.post("/api/admin/index/ab-test")
+async def start_index_ab_test(request: ABTestRequest, tenant_id: Optional[str] = None):
+    """Serve a candidate snapshot to a stable share of students."""
+    rag = await _tenant_rag(tenant_id)
+    try:
+        await run_in_threadpool(rag.start_ab_test, request.version, request.share)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ab_test": rag.ab_test}
+
+
+@app.delete("/api/admin/index/ab-test")
+async def stop_index_ab_test(tenant_id: Optional[str] = None):
+    rag = await _tenant_rag(tenant_id)
+    await run_in_threadpool(rag.stop_ab_test)
+    return {"ab_test": None}
+
+
+@app.get("/api/admin/tenants")
+async def list_tenants():
+    """Known campuses, the ones with an index in memory and load/eviction counts."""
+    return llm_agent.tenants.get_stats()
+
+
 @app.get("/api/demo-ready")
 async def check_demo_ready():
     """Pre-demo checklist dashboard."""
@@ -717,7 +909,7 @@ async def get_roommate_matches_guide(student_id: str):
                 "lifestyle": ["None of these"],
                 "morning_routine": "flexible",
             }
-            ai_summary = _generate_llama_summary(
+            ai_summary = await _generate_llama_summary(
                 student_name="You",
                 match_name="Rahul Verma",
                 score=87,
@@ -753,9 +945,9 @@ async def get_roommate_matches_guide(student_id: str):
         current = next((s for s in all_students if s["id"] == student_id), {})
         current_name = current.get("name", "You")
 
-        # Enrich each match with a Llama-generated summary
-        for m in raw_matches:
-            m["ai_summary"] = _generate_llama_summary(
+        # Enrich each match with a Llama-generated summary (concurrently, over the shared pool)
+        summaries = await asyncio.gather(*(
+            _generate_llama_summary(
                 student_name=current_name,
                 match_name=m["name"],
                 score=m["compatibility"],
@@ -763,6 +955,10 @@ async def get_roommate_matches_guide(student_id: str):
                 challenges=m.get("challenges", []),
                 shared_interests=m.get("shared_interests", []),
             )
+            for m in raw_matches
+        ))
+        for m, summary in zip(raw_matches, summaries):
+            m["ai_summary"] = summary
 
         return {
             "success": True,
@@ -776,7 +972,7 @@ async def get_roommate_matches_guide(student_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def _generate_llama_summary(
+async def _generate_llama_summary(
     student_name: str,
     match_name: str,
     score: float,
@@ -798,16 +994,12 @@ Shared interests: {interests_text}.
 Keep it casual, encouraging, and specific. Return ONLY the 2 sentences — no bullet points, no preamble."""
 
     try:
-        import requests as req
-        resp = req.post(
-            "http://localhost:11434/api/generate",
-            json={"model": "gemma3:4b", "prompt": prompt, "stream": False, "options": {"temperature": 0.75, "num_predict": 80}},
-            timeout=12,
-        )
-        if resp.status_code == 200:
-            text = resp.json().get("response", "").strip()
-            if text:
-                return text
+        # Concurrent match pages asking for the same pair share one generation
+        resp = await llm_agent.inflight.ado(("roommate_summary", prompt), ollama_instance.agenerate, prompt,
+                                            caller="roommate_summary", options={"temperature": 0.75, "num_predict": 80})
+        text = resp.get("response", "").strip()
+        if text:
+            return text
     except Exception:
         pass
 
@@ -951,7 +1143,7 @@ async def get_lectures(request: dict):
 async def generate_quiz(request: dict):
     subject = request.get("subject", "Programming")
     topic = request.get("topic", "basics")
-    questions = llm_agent.generate_quiz(subject, topic)
+    questions = await run_in_threadpool(llm_agent.generate_quiz, subject, topic)
     return {"success": True, "subject": subject, "topic": topic, "questions": questions}
 
 @app.get("/api/acad/groups")
@@ -0,0 +1,157 @@
+"""
+BM25 Index — in-memory inverted index for lexical retrieval
+Serves keyword search over knowledge base chunks without touching disk per query
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Common English words that carry no retrieval signal in student questions
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "am", "do", "does", "did",
+    "i", "me", "my", "we", "our", "you", "your", "he", "she", "it", "they", "them", "their",
+    "what", "which", "who", "whom", "when", "where", "why", "how", "this", "that", "these",
+    "those", "to", "of", "in", "on", "at", "for", "with", "by", "from", "about", "as", "into",
+    "and", "or", "but", "if", "so", "than", "then", "there", "here", "can", "could", "should",
+    "would", "will", "shall", "may", "might", "must", "have", "has", "had", "any", "all",
+    "some", "tell", "please", "need", "want", "know", "get",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of chunks.
+    Postings map each term to (doc_index, term_frequency) pairs so a query only
+    touches documents that share at least one term with it.
+
+    With partition_key set (e.g. "category"), a sub-index is maintained per
+    metadata value so filtered searches only score that partition.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, partition_key: Optional[str] = None):
+        self.k1 = k1
+        self.b = b
+        self.partition_key = partition_key
+        self.partitions: Dict[str, "BM25Index"] = {}
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._id_to_index: Dict[str, int] = {}
+        self._removed: set = set()
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.ids) - len(self._removed)
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._total_length / len(self) if len(self) else 0.0
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Add documents; an existing id is replaced by its new content."""
+        for doc_id, text, meta in zip(ids, documents, metadatas):
+            if doc_id in self._id_to_index:
+                self.remove([doc_id])
+
+            idx = len(self.ids)
+            tokens = tokenize(text)
+            self.ids.append(doc_id)
+            self.documents.append(text)
+            self.metadatas.append(meta)
+            self.doc_lengths.append(len(tokens))
+            self._id_to_index[doc_id] = idx
+            self._total_length += len(tokens)
+
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append((idx, tf))
+
+            if self.partition_key:
+                partition = self.partitions.get(meta.get(self.partition_key))
+                if partition is None:
+                    partition = self.partitions[meta.get(self.partition_key)] = BM25Index(self.k1, self.b)
+                partition.add([doc_id], [text], [meta])
+
+    def remove(self, ids: List[str]):
+        """Tombstone documents; their postings are skipped at query time."""
+        for doc_id in ids:
+            idx = self._id_to_index.pop(doc_id, None)
+            if idx is not None:
+                self._removed.add(idx)
+                self._total_length -= self.doc_lengths[idx]
+                if self.partition_key:
+                    partition = self.partitions.get(self.metadatas[idx].get(self.partition_key))
+                    if partition is not None:
+                        partition.remove([doc_id])
+
+    def items(self) -> List[Tuple[str, str, Dict]]:
+        """Live (id, text, metadata) triples."""
+        return [
+            (self.ids[i], self.documents[i], self.metadatas[i])
+            for i in range(len(self.ids)) if i not in self._removed
+        ]
+
+    def idf(self, term: str) -> float:
+        postings = self.postings.get(term, [])
+        df = sum(1 for idx, _ in postings if idx not in self._removed)
+        n = len(self)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 3, category: Optional[str] = None) -> List[Dict]:
+        """
+        Rank documents against the query.
+
+        Returns:
+            List of dicts with 'id', 'text', 'category', 'source', 'score' and 'bm25' keys.
+            'score' is the fraction of query terms present in the chunk (0-1), so it
+            stays comparable with the similarity thresholds used by the agent.
+        """
+        if category is not None and self.partition_key == "category":
+            partition = self.partitions.get(category)
+            return partition.search(query, top_k) if partition is not None else []
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not len(self):
+            return []
+
+        avgdl = self.avg_doc_length or 1.0
+        scores: Dict[int, float] = {}
+        matched: Counter = Counter()
+
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for idx, tf in postings:
+                if idx in self._removed:
+                    continue
+                if category and self.metadatas[idx].get("category") != category:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / avgdl)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched[idx] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {
+                "id": self.ids[idx],
+                "text": self.documents[idx],
+                "category": self.metadatas[idx].get("category", "unknown"),
+                "source": self.metadatas[idx].get("source", ""),
+                "score": round(matched[idx] / len(terms), 3),
+                "bm25": round(score, 3),
+            }
+            for idx, score in ranked
+        ]
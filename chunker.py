@@ -0,0 +1,137 @@
+"""
+Markdown Chunker — streaming, token-aware splitter for knowledge base files
+Reads files line by line and yields overlapping chunks tagged with their heading path
+"""
+
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Approximates BERT-style pre-tokenization (words and individual punctuation marks),
+# which is what all-MiniLM-L6-v2 sees before WordPiece
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+HEADING_PATTERN = re.compile(r"^(#{1,3})\s+(.*)$")
+
+HEADING_SEPARATOR = " > "
+
+
+def count_tokens(text: str) -> int:
+    """Tokenizer-free token count used to size chunks."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+class MarkdownChunker:
+    """
+    Splits markdown into chunks of at most `chunk_tokens` tokens.
+
+    - `#`, `##` and `###` headings close the current chunk and update the heading path
+    - Long lines are split on sentence boundaries, so chunks never end mid-sentence
+      unless a single sentence exceeds the budget
+    - Consecutive chunks of one section share up to `overlap_tokens` trailing tokens
+    - Every chunk starts with its nearest heading line and carries the full path
+      (e.g. "Fee Structure > Payment Methods") in `heading_path`
+    """
+
+    def __init__(self, chunk_tokens: int = 200, overlap_tokens: int = 40,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = token_counter or count_tokens
+
+    def iter_file(self, file_path: Path) -> Iterator[Dict]:
+        """Stream chunks from a file without reading it into memory."""
+        with open(file_path, encoding="utf-8") as f:
+            yield from self.iter_lines(line.rstrip("\n") for line in f)
+
+    def iter_lines(self, lines: Iterable[str]) -> Iterator[Dict]:
+        """
+        Yields:
+            Dicts with 'text' and 'heading_path' keys
+        """
+        headings: List[Tuple[int, str]] = []
+        units: List[Tuple[str, int]] = []  # (text, token count) for the current chunk
+        unit_tokens = 0
+
+        def heading_line() -> str:
+            if not headings:
+                return ""
+            level, title = headings[-1]
+            return f"{'#' * level} {title}"
+
+        def emit(body: List[Tuple[str, int]]) -> Optional[Dict]:
+            text = "\n".join(u for u, _ in body).strip()
+            if not text:
+                return None
+            header = heading_line()
+            return {
+                "text": f"{header}\n{text}" if header else text,
+                "heading_path": HEADING_SEPARATOR.join(title for _, title in headings),
+            }
+
+        for line in lines:
+            match = HEADING_PATTERN.match(line)
+            if match:
+                chunk = emit(units)
+                if chunk:
+                    yield chunk
+                units, unit_tokens = [], 0
+
+                level = len(match.group(1))
+                headings = [h for h in headings if h[0] < level]
+                headings.append((level, match.group(2).strip()))
+                continue
+
+            # Every chunk repeats its heading line, so it counts against the budget
+            budget = max(self.chunk_tokens - self.count_tokens(heading_line()), self.chunk_tokens // 2)
+            for piece in self._split_line(line, budget):
+                tokens = self.count_tokens(piece)
+                if units and unit_tokens + tokens > budget:
+                    chunk = emit(units)
+                    if chunk:
+                        yield chunk
+                    units = self._overlap(units)
+                    unit_tokens = sum(t for _, t in units)
+                    if unit_tokens + tokens > budget:
+                        units, unit_tokens = [], 0
+                units.append((piece, tokens))
+                unit_tokens += tokens
+
+        chunk = emit(units)
+        if chunk:
+            yield chunk
+
+    def _split_line(self, line: str, budget: int) -> List[str]:
+        """Break a line into sentence-sized pieces that each fit the token budget."""
+        if self.count_tokens(line) <= budget:
+            return [line]
+
+        pieces = []
+        for sentence in SENTENCE_BOUNDARY.split(line):
+            if self.count_tokens(sentence) <= budget:
+                pieces.append(sentence)
+                continue
+            # A single oversized sentence: fall back to word windows
+            words, window = sentence.split(), []
+            for word in words:
+                if window and self.count_tokens(" ".join(window + [word])) > budget:
+                    pieces.append(" ".join(window))
+                    window = []
+                window.append(word)
+            if window:
+                pieces.append(" ".join(window))
+        return pieces
+
+    def _overlap(self, units: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """Trailing units of the previous chunk that fit in the overlap budget."""
+        carried, total = [], 0
+        for text, tokens in reversed(units):
+            if not text.strip():
+                continue
+            if total + tokens > self.overlap_tokens:
+                break
+            carried.insert(0, (text, tokens))
+            total += tokens
+        return carried
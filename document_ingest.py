@@ -0,0 +1,298 @@
+"""
+Document Ingest — parallel conversion of PDF/HTML/DOCX circulars into the knowledge base
+Parses files in a process pool, writes each as markdown under knowledge_base/<category>/
+and lets RAGEngine index the lot in one incremental, batched build
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from xml.etree import ElementTree
+
+# pypdf is pure Python; without it PDFs are reported as skipped
+PDF_AVAILABLE = importlib.util.find_spec("pypdf") is not None
+
+SUPPORTED_SUFFIXES = {".pdf", ".html", ".htm", ".docx", ".txt", ".md"}
+
+# Where converted files go, relative to the knowledge base: one category directory
+DEFAULT_CATEGORY = "circulars"
+
+# Source path -> {sha256, output} of earlier runs, so unchanged circulars are not re-parsed
+INGEST_MANIFEST = ".ingest_manifest.json"
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class _HTMLToMarkdown(HTMLParser):
+    """Keeps headings (h1-h3 as #..###), paragraphs, list items and table rows."""
+
+    BLOCKS = {"p", "div", "li", "tr", "br", "section", "article", "blockquote", "h4", "h5", "h6"}
+    SKIP = {"script", "style", "nav", "header", "footer", "noscript", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.lines: List[str] = []
+        self.title = ""
+        self._buffer: List[str] = []
+        self._prefix = ""
+        self._skip = 0
+        self._in_title = False
+
+    def _flush(self):
+        text = _clean("".join(self._buffer))
+        if text:
+            self.lines.append(self._prefix + text)
+        self._buffer, self._prefix = [], ""
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in ("h1", "h2", "h3"):
+            self._flush()
+            self._prefix = "#" * int(tag[1]) + " "
+        elif tag in self.BLOCKS:
+            self._flush()
+            if tag == "li":
+                self._prefix = "- "
+        elif tag in ("td", "th") and self._buffer:
+            self._buffer.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in self.SKIP:
+            self._skip = max(0, self._skip - 1)
+        elif tag in ("h1", "h2", "h3") or tag in self.BLOCKS:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip:
+            self._buffer.append(data)
+
+    def markdown(self) -> str:
+        self._flush()
+        lines = self.lines
+        if not any(line.startswith("# ") for line in lines) and _clean(self.title):
+            lines = [f"# {_clean(self.title)}"] + lines
+        return "\n\n".join(lines)
+
+
+def html_to_markdown(html: str) -> str:
+    parser = _HTMLToMarkdown()
+    parser.feed(html)
+    parser.close()
+    return parser.markdown()
+
+
+def pdf_to_markdown(path: Path) -> str:
+    """Page text from the PDF's text layer (scanned circulars need OCR first)."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(path))
+    paragraphs = []
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        # Blank lines separate paragraphs; lines within one are re-joined
+        for block in re.split(r"\n\s*\n", text):
+            block = _clean(block)
+            if block:
+                paragraphs.append(block)
+    return "\n\n".join(paragraphs)
+
+
+def docx_to_markdown(path: Path) -> str:
+    """Paragraphs from word/document.xml; Title/Heading 1-3 styles become # headings."""
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read("word/document.xml"))
+
+    lines = []
+    for paragraph in root.iter(f"{WORD_NS}p"):
+        text = _clean("".join(node.text or "" for node in paragraph.iter(f"{WORD_NS}t")))
+        if not text:
+            continue
+        style = paragraph.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+        style = style.get(f"{WORD_NS}val", "") if style is not None else ""
+        level = 1 if style == "Title" else int(style[-1]) if re.fullmatch(r"Heading[1-3]", style) else 0
+        lines.append(f"{'#' * level} {text}" if level else text)
+    return "\n\n".join(lines)
+
+
+def convert_file(path: str) -> Dict:
+    """
+    Convert one document to markdown (runs in a worker process).
+
+    Returns:
+        Dict with 'source', 'markdown' and 'sha256', or 'source' and 'error'
+    """
+    source = Path(path)
+    try:
+        data = source.read_bytes()
+        suffix = source.suffix.lower()
+        if suffix == ".pdf":
+            if not PDF_AVAILABLE:
+                return {"source": path, "error": "pypdf not installed"}
+            markdown = pdf_to_markdown(source)
+        elif suffix in (".html", ".htm"):
+            markdown = html_to_markdown(data.decode("utf-8", errors="replace"))
+        elif suffix == ".docx":
+            markdown = docx_to_markdown(source)
+        else:
+            markdown = data.decode("utf-8", errors="replace")
+
+        if not markdown.strip():
+            return {"source": path, "error": "no extractable text"}
+        if not markdown.lstrip().startswith("# "):
+            # The file's title heads every chunk (see MarkdownChunker)
+            title = source.stem.replace("_", " ").replace("-", " ").strip()
+            markdown = f"# {title}\n\n{markdown}"
+        return {"source": path, "markdown": markdown.strip() + "\n",
+                "sha256": hashlib.sha256(data).hexdigest()}
+    except Exception as e:
+        return {"source": path, "error": str(e)}
+
+
+def find_documents(paths: Iterable[str]) -> List[Path]:
+    """Supported files among `paths` (absolute, so manifest keys survive a cwd change), recursing into directories."""
+    found = []
+    for p in map(Path, paths):
+        candidates = p.rglob("*") if p.is_dir() else [p]
+        found.extend(f.resolve() for f in candidates if f.is_file() and f.suffix.lower() in SUPPORTED_SUFFIXES)
+    return sorted(set(found))
+
+
+def _slug(path: Path) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", path.stem.lower()).strip("-") or "document"
+
+
+def _write_atomic(path: Path, text: str):
+    """Write via rename so the RAG watcher never indexes a half-written file."""
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def ingest(paths: Iterable[str], knowledge_dir: str = "knowledge_base", category: str = DEFAULT_CATEGORY,
+           workers: Optional[int] = None, engine=None, force: bool = False) -> Dict:
+    """
+    Convert documents into knowledge_dir/<category>/*.md in parallel.
+
+    Unchanged sources (same sha256 as the last run) are skipped. With `engine`
+    (a RAGEngine over knowledge_dir) the new files are indexed in one
+    incremental build once conversion finishes.
+
+    Returns:
+        Progress/throughput report
+    """
+    start = time.perf_counter()
+    target_dir = Path(knowledge_dir) / category
+    target_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = target_dir / INGEST_MANIFEST
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+
+    documents = find_documents(paths)
+    todo = []
+    for doc in documents:
+        previous = manifest.get(str(doc))
+        if (not force and previous and (target_dir / previous["output"]).exists()
+                and previous["sha256"] == hashlib.sha256(doc.read_bytes()).hexdigest()):
+            continue
+        todo.append(doc)
+
+    # Distinct output names, also across sources that slug to the same stem
+    pending = {str(doc) for doc in todo}
+    taken = {entry["output"] for src, entry in manifest.items() if src not in pending}
+    outputs = {}
+    for doc in todo:
+        previous = manifest.get(str(doc))
+        name = previous["output"] if previous else f"{_slug(doc)}.md"
+        n = 2
+        while name in taken:
+            name = f"{_slug(doc)}-{n}.md"
+            n += 1
+        taken.add(name)
+        outputs[str(doc)] = name
+
+    report = {"found": len(documents), "unchanged": len(documents) - len(todo),
+              "converted": 0, "failed": [], "bytes": 0}
+    print(f"📥 Ingesting {len(todo)} of {len(documents)} documents into {target_dir} "
+          f"({report['unchanged']} unchanged)")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(convert_file, str(doc)) for doc in todo]
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                if "error" in result:
+                    report["failed"].append({"source": result["source"], "error": result["error"]})
+                else:
+                    output = outputs[result["source"]]
+                    _write_atomic(target_dir / output, result["markdown"])
+                    manifest[result["source"]] = {"sha256": result["sha256"], "output": output}
+                    report["converted"] += 1
+                    report["bytes"] += len(result["markdown"].encode("utf-8"))
+                if done % 25 == 0 or done == len(futures):
+                    elapsed = time.perf_counter() - start
+                    print(f"   … {done}/{len(futures)} parsed ({done / elapsed:.1f} files/sec)")
+        _write_atomic(manifest_path, json.dumps(manifest, indent=1))
+
+    parse_seconds = time.perf_counter() - start
+    report["parse_seconds"] = round(parse_seconds, 3)
+    report["files_per_sec"] = round(len(todo) / parse_seconds, 1) if parse_seconds > 0 else 0.0
+
+    if engine is not None and report["converted"]:
+        engine.wait_until_ready()
+        engine.refresh()
+        report["index"] = engine.last_index_stats
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"✅ Ingested {report['converted']} documents ({len(report['failed'])} failed) "
+          f"in {report['seconds']:.2f}s")
+    for failure in report["failed"]:
+        print(f"⚠️  {failure['source']}: {failure['error']}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDF/HTML/DOCX circulars into the knowledge base")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--knowledge-dir", default="knowledge_base")
+    parser.add_argument("--category", default=DEFAULT_CATEGORY, help="Category (subdirectory) for the documents")
+    parser.add_argument("--workers", type=int, help="Parser processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-parse unchanged documents")
+    parser.add_argument("--index", action="store_true", help="Index the converted files right away")
+    parser.add_argument("--store", help="Vector store to index into (with --index; default: RAG_STORE or chroma)")
+    parser.add_argument("--db-dir", default="chroma_db")
+    args = parser.parse_args()
+
+    engine = None
+    if args.index:
+        from rag_engine import RAGEngine
+
+        engine = RAGEngine(knowledge_dir=args.knowledge_dir, db_dir=args.db_dir, store=args.store,
+                           background=False, batch_wait_ms=0)
+    report = ingest(args.paths, args.knowledge_dir, args.category, args.workers, engine, args.force)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,12 @@ Features: OCR (PaddleOCR), Image Quality Checks (OpenCV), and AI Validation (Lla
 import os
 import re
 import json
-import requests
 import numpy as np
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable, ollama_instance
+
 try:
     from paddleocr import PaddleOCR
     import cv2
@@ -34,9 +35,10 @@ REQUIRED_DOCS = [
 ]
 
 class DocumentProcessor:
-    def __init__(self, ollama_url: str = "http://localhost:11434"):
-        self.ollama_url = ollama_url
-        self.model = "gemma3:4b" # Using Gemma 3 4B as confirmed in previous test, powerful and fast
+    def __init__(self, ollama_url: Optional[str] = None):
+        self.llm = OllamaClient(ollama_url) if ollama_url else ollama_instance
+        self.ollama_url = self.llm.base_url
+        self.model = self.llm.model_for("document") # Gemma 3 4B by default, powerful and fast
         if PADDLE_AVAILABLE:
             self.ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
         else:
@@ -179,39 +181,31 @@ class DocumentProcessor:
         prompt = prompts.get(doc_type, default_prompt)
         
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "format": "json",
-                    "stream": False,
-                    "options": {"temperature": 0.1}
-                },
-                timeout=30
-            )
+            try:
+                result = self.llm.generate(prompt, caller="document", format="json",
+                                           options={"temperature": 0.1}, model=self.model)
+            except OllamaUnavailable:
+                raise  # Ollama not running: demo-mode fallback below
+            except OllamaError:
+                return {"valid": False, "issues": ["AI validation service unavailable"]}
+            ai_doc = json.loads(result.get("response", "{}"))
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_doc = json.loads(result.get("response", "{}"))
-                
-                # --- Fix #8: Safety Override for Marksheets ---
-                if ("marksheet" in doc_type) and not ai_doc.get("valid"):
-                    indicators = [
-                        "marks", "percentage", "grade", "subject", "board", 
-                        "ssc", "hsc", "cbse", "icse", "maharashtra", 
-                        "math", "science", "english", "total"
-                    ]
-                    found_count = sum(1 for word in indicators if word in extracted_text.lower())
-                    
-                    if found_count >= 3:
-                        ai_doc["valid"] = True
-                        ai_doc["confidence"] = 0.65
-                        ai_doc["reason"] = f"AI was strict but keyword override found {found_count} indicators."
-                        ai_doc["issues"] = []
+            # --- Fix #8: Safety Override for Marksheets ---
+            if ("marksheet" in doc_type) and not ai_doc.get("valid"):
+                indicators = [
+                    "marks", "percentage", "grade", "subject", "board", 
+                    "ssc", "hsc", "cbse", "icse", "maharashtra", 
+                    "math", "science", "english", "total"
+                ]
+                found_count = sum(1 for word in indicators if word in extracted_text.lower())
                 
-                return ai_doc
-            return {"valid": False, "issues": ["AI validation service unavailable"]}
+                if found_count >= 3:
+                    ai_doc["valid"] = True
+                    ai_doc["confidence"] = 0.65
+                    ai_doc["reason"] = f"AI was strict but keyword override found {found_count} indicators."
+                    ai_doc["issues"] = []
+            
+            return ai_doc
         except Exception as e:
             # --- demo mode fallback (Fix Connection Refused) ---
             print(f"AI Validation Error (Demo Mode Fallback): {e}")
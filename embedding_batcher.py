@@ -0,0 +1,154 @@
+"""
+Embedding Batcher — dynamic micro-batching for query encodes
+Collects concurrent encode requests for a few milliseconds and runs them as one forward pass
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Longest a caller waits for its rows (a stuck encoder must not hang requests forever)
+ENCODE_TIMEOUT = 30.0
+
+
+class EmbeddingBatcher:
+    """
+    A single worker thread owns the encoder. Callers submit() texts and get a
+    Future; the worker waits up to `max_wait_ms` after the first pending request
+    for more to arrive (or until `max_batch` texts are queued), encodes them all
+    in one call and resolves each caller's Future with its own rows.
+
+    A burst of N concurrent questions costs one batched encode instead of N
+    single-row encodes contending for the GIL.
+
+    After close(), submit() encodes inline on the caller's thread, so requests
+    still holding an evicted engine finish without starting a new worker.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List], max_batch: int = 64,
+                 max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stats = {"requests": 0, "batches": 0, "texts": 0, "largest_batch": 0}
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue texts for encoding; the Future resolves to one vector per text."""
+        future: Future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        # The closed check and the put share the lock, so nothing lands behind close()'s sentinel
+        with self._start_lock:
+            if not self._closed:
+                self._ensure_worker()
+                self._queue.put((list(texts), future))
+                return future
+        try:
+            future.set_result(self.encode_fn(list(texts)))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def encode(self, texts: List[str], timeout: Optional[float] = ENCODE_TIMEOUT) -> List:
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(texts).result(timeout)
+
+    def _ensure_worker(self):
+        """Start the worker if it is not running; called with _start_lock held."""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stop the worker after it drains the requests already queued. Requests the
+        worker did not get to (it was stuck past `timeout`) fail instead of hanging.
+        """
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+            worker = self._worker
+            if worker is not None:
+                self._queue.put(None)
+        if worker is not None:
+            worker.join(timeout)
+        self._worker = None
+
+        stop_pending = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stop_pending = True
+            elif item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("embedding batcher closed"))
+        if stop_pending:
+            # A worker still busy past the timeout must find its stop signal afterwards
+            self._queue.put(None)
+
+    def _collect(self, first: Tuple[List[str], Future]) -> Tuple[List[Tuple[List[str], Future]], bool]:
+        """Gather requests until the batch is full or the wait window closes."""
+        pending = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return pending, True
+            pending.append(item)
+            size += len(item[0])
+        return pending, False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending, stop = self._collect(item)
+
+            # Callers that gave up (cancelled futures) are dropped before encoding
+            pending = [(texts, f) for texts, f in pending if f.set_running_or_notify_cancel()]
+            texts = [t for batch, _ in pending for t in batch]
+            if texts:
+                try:
+                    vectors = self.encode_fn(texts)
+                    offset = 0
+                    for batch, future in pending:
+                        future.set_result(vectors[offset:offset + len(batch)])
+                        offset += len(batch)
+                except Exception as e:
+                    for _, future in pending:
+                        future.set_exception(e)
+
+                self._stats["requests"] += len(pending)
+                self._stats["batches"] += 1
+                self._stats["texts"] += len(texts)
+                self._stats["largest_batch"] = max(self._stats["largest_batch"], len(texts))
+
+            if stop:
+                return
+
+    def stats(self) -> Dict:
+        batches = self._stats["batches"]
+        return {
+            **self._stats,
+            "avg_batch": round(self._stats["texts"] / batches, 2) if batches else 0.0,
+            "queued": self._queue.qsize(),
+            "max_wait_ms": self.max_wait * 1000,
+        }
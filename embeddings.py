@@ -0,0 +1,319 @@
+"""
+Embeddings — pluggable embedding backends for RAGEngine
+SentenceTransformer (PyTorch), ONNX Runtime (int8 CPU export) and a dependency-free
+hashing vectorizer, all behind the SentenceTransformer-style encode() call
+"""
+
+import hashlib
+import importlib.util
+import math
+import re
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+# Backends accepted by RAGEngine(embedding_backend=...)
+EMBEDDING_BACKENDS = ("auto", "sentence-transformers", "onnx", "hashing")
+
+# Checked without importing: torch alone adds seconds to startup
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+ONNX_AVAILABLE = (importlib.util.find_spec("onnxruntime") is not None
+                  and importlib.util.find_spec("tokenizers") is not None)
+
+# File names tried, in order, inside an ONNX model directory
+ONNX_MODEL_FILES = ("model_quantized.onnx", "model_int8.onnx", "model.onnx")
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface RAGEngine encodes through. encode() mirrors SentenceTransformer.encode
+    and returns L2-normalized float32 rows; fingerprint() identifies the vector
+    space, so the index is rebuilt whenever the backend changes.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        """Embed texts into L2-normalized (len(texts), dim) float32 rows."""
+
+    def fingerprint(self) -> Dict:
+        return {"model": self.name}
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """PyTorch inference through sentence-transformers."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                 convert_to_numpy=True, normalize_embeddings=True)
+
+    def fingerprint(self) -> Dict:
+        return {"model": self.model_name}
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime CPU inference of a sentence-transformers export, e.g. a dynamically
+    quantized int8 all-MiniLM-L6-v2 (see quantize_onnx_model). Needs onnxruntime and
+    tokenizers only, no torch.
+
+    `model_path` is a directory holding tokenizer.json and one of ONNX_MODEL_FILES,
+    or the .onnx file itself (tokenizer.json next to it). Token embeddings are
+    mean-pooled over the attention mask and L2-normalized, like the PyTorch model.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, max_length: int = 256, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = Path(model_path)
+        if path.is_dir():
+            model_file = next((path / f for f in ONNX_MODEL_FILES if (path / f).exists()), None)
+            if model_file is None:
+                raise FileNotFoundError(f"No ONNX model ({', '.join(ONNX_MODEL_FILES)}) in {path}")
+        else:
+            model_file, path = path, path.parent
+        self.model_file = model_file
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_file), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Length-sorted batches keep padding (and wasted compute) to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        outputs: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                outputs[i] = vector
+        return np.stack(outputs)
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return _l2_normalize(pooled.astype(np.float32))
+
+    def fingerprint(self) -> Dict:
+        return {
+            "model": "onnx",
+            "file": self.model_file.name,
+            "bytes": self.model_file.stat().st_size,
+        }
+
+
+def quantize_onnx_model(model_dir: str, source: str = "model.onnx",
+                        target: str = "model_quantized.onnx") -> Path:
+    """
+    Dynamic int8 quantization of an exported model (weights int8, activations
+    quantized at runtime). Export first, e.g.:
+        optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 <model_dir>
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = Path(model_dir)
+    quantize_dynamic(str(model_dir / source), str(model_dir / target), weight_type=QuantType.QInt8)
+    return model_dir / target
+
+
+class HashingEmbedder(EmbeddingBackend):
+    """
+    Feature hashing with corpus IDF weights:
+
+    - word unigrams and bigrams, plus character n-grams of each word (padded
+      with spaces, so prefixes and suffixes are features of their own)
+    - each feature is hashed (crc32) to one of `dim` buckets with a hash-derived
+      sign, so colliding features tend to cancel rather than pile up
+    - term frequencies are damped (1 + log tf), weighted by IDF and L2-normalized
+
+    No model files and no dependencies beyond NumPy.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 4096, char_ngrams: tuple = (3, 5), word_ngrams: int = 2):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.word_ngrams = word_ngrams
+        self.idf: Optional[np.ndarray] = None
+
+    def _features(self, text: str) -> Counter:
+        words = WORD_PATTERN.findall(text.lower())
+        features = Counter(words)
+        for n in range(2, self.word_ngrams + 1):
+            features.update(" ".join(words[i:i + n]) for i in range(len(words) - n + 1))
+
+        low, high = self.char_ngrams
+        for word in words:
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                features.update("#" + padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def _buckets(self, features: Counter) -> Dict[int, float]:
+        """Signed bucket counts: bucket from the hash, sign from its top bit."""
+        buckets: Dict[int, float] = {}
+        for feature, tf in features.items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = -1.0 if h & 0x80000000 else 1.0
+            bucket = h % self.dim
+            buckets[bucket] = buckets.get(bucket, 0.0) + sign * (1.0 + math.log(tf))
+        return buckets
+
+    def fit(self, texts: Iterable[str]) -> "HashingEmbedder":
+        """Learn smoothed IDF weights per bucket from a corpus (streamed once)."""
+        df = np.zeros(self.dim, dtype=np.float64)
+        n = 0
+        for text in texts:
+            n += 1
+            buckets = {zlib.crc32(f.encode("utf-8")) % self.dim for f in self._features(text)}
+            df[list(buckets)] += 1
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        return self
+
+    def fitted(self, texts: Iterable[str]) -> "HashingEmbedder":
+        """A copy with IDF learned from `texts`; this instance keeps serving queries meanwhile."""
+        return HashingEmbedder(self.dim, self.char_ngrams, self.word_ngrams).fit(texts)
+
+    def encode(self, texts: List[str], batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        """Embed texts into L2-normalized (len(texts), dim) float32 rows."""
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = self._buckets(self._features(text))
+            if buckets:
+                vectors[row, list(buckets)] = list(buckets.values())
+
+        if self.idf is not None:
+            vectors *= self.idf
+        return _l2_normalize(vectors)
+
+    def fingerprint(self) -> Dict:
+        """Settings that determine the vectors; stored vectors are only comparable if it matches."""
+        idf_hash = hashlib.md5(self.idf.tobytes()).hexdigest() if self.idf is not None else None
+        return {
+            "model": "hashing",
+            "dim": self.dim,
+            "char_ngrams": list(self.char_ngrams),
+            "word_ngrams": self.word_ngrams,
+            "idf": idf_hash,
+        }
+
+    def save(self, path: Path):
+        if self.idf is not None:
+            np.save(path, self.idf)
+
+    def load(self, path: Path) -> bool:
+        path = Path(path)
+        if not path.exists():
+            return False
+        idf = np.load(path)
+        if idf.shape != (self.dim,):
+            return False
+        self.idf = idf.astype(np.float32)
+        return True
+
+
+def resolve_backend(name: str = "auto", model_path: Optional[str] = None) -> str:
+    """
+    Concrete backend for `name`. "auto" prefers ONNX when a model path is given,
+    then sentence-transformers, then the hashing vectorizer.
+    """
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"embedding_backend must be one of {EMBEDDING_BACKENDS}")
+    if name != "auto":
+        return name
+    if model_path and ONNX_AVAILABLE:
+        return "onnx"
+    if SENTENCE_TRANSFORMERS_AVAILABLE:
+        return "sentence-transformers"
+    return "hashing"
+
+
+def create_backend(name: str = "auto", model_path: Optional[str] = None) -> EmbeddingBackend:
+    name = resolve_backend(name, model_path)
+    if name == "onnx":
+        if not model_path:
+            raise ValueError("The onnx embedding backend needs a model path")
+        return OnnxBackend(model_path)
+    if name == "sentence-transformers":
+        return SentenceTransformerBackend(model_path or DEFAULT_MODEL)
+    return HashingEmbedder()
+
+
+_shared_backends: Dict[tuple, EmbeddingBackend] = {}
+_shared_lock = threading.Lock()
+
+
+def load_backend(name: str = "auto", model_path: Optional[str] = None) -> EmbeddingBackend:
+    """
+    create_backend(), memoized per process: every RAGEngine (e.g. one per tenant)
+    on the same backend shares one model instead of loading its own copy.
+    """
+    key = (resolve_backend(name, model_path), model_path)
+    with _shared_lock:
+        if key not in _shared_backends:
+            _shared_backends[key] = create_backend(*key)
+        return _shared_backends[key]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3 or sys.argv[1] != "quantize":
+        print("Usage: python embeddings.py quantize <onnx_model_dir>")
+        sys.exit(1)
+    print(f"✅ Wrote {quantize_onnx_model(sys.argv[2])}")
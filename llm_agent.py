@@ -3,12 +3,16 @@ Local LLM Agent — RAG-augmented, context-aware AI chatbot
 Uses Ollama for local inference with ChromaDB knowledge retrieval
 """
 
-import requests
 import json
 import re
-from typing import Dict, Optional, List
-
-from rag_engine import RAGEngine
+import time
+from typing import Dict, Iterator, Optional, List
+
+from llm_cache import ResponseCache
+from ollama_client import OllamaClient, OllamaUnavailable, ollama_instance
+from semantic_cache import SemanticCache
+from single_flight import SingleFlight
+from tenant_registry import TenantRegistry
 from safety import detect_crisis, HELPLINES
 from session_manager import SessionManager
 
@@ -54,6 +58,18 @@ TRANSLATIONS = {
     }
 }
 
+# Generation options for chat turns
+CHAT_OPTIONS = {
+    "temperature": 0.3,  # Fast and consistent
+    "top_p": 0.9,
+    "num_predict": 100,  # Force short responses (Fix #4)
+    "num_ctx": 2048,     # Optimized context window
+    "stop": ["\n\n", "4.", "5."], # Stop after 3 points (Fix #4)
+}
+
+# Minimum best-hit score for an intent-partitioned search before widening to the full KB
+PARTITION_MIN_SCORE = 0.5
+
 # Language detection keywords (simple heuristic)
 LANGUAGE_HINTS = {
     "hi": ["kya", "kaise", "mujhe", "hai", "kab", "kitna", "batao", "chahiye", "hota", "mein"],
@@ -70,11 +86,21 @@ class LocalLLMAgent:
     - Routes to domain-specific handlers
     """
 
-    def __init__(self, model: str = "gemma3:4b", base_url: str = "http://localhost:11434"):
-        self.model = model
-        self.base_url = base_url
-        self.rag = RAGEngine()
+    def __init__(self, model: Optional[str] = None, base_url: Optional[str] = None):
+        # Shared pooled client (OLLAMA_URL / OLLAMA_MODEL) unless pointed elsewhere
+        self.llm = OllamaClient(base_url, model) if base_url else ollama_instance
+        self.model = model or self.llm.model_for("chat")
+        self.base_url = self.llm.base_url
+        # One knowledge base per campus; self.rag is the default tenant's (always loaded)
+        self.tenants = TenantRegistry()
+        self.rag = self.tenants.get()
         self.sessions = SessionManager()
+        # Exact-match answers for repeated prompts, per tenant and knowledge-base fingerprint
+        self.response_cache = ResponseCache()
+        # Answers to recent questions, reused for close paraphrases before any retrieval
+        self.semantic_cache = SemanticCache()
+        # Identical prompts generated concurrently (announcement bursts) share one Ollama call
+        self.inflight = SingleFlight()
 
         self.system_prompt = """You are CampusCompanion AI, an intelligent onboarding assistant for TCET Mumbai students.
 
@@ -104,30 +130,159 @@ FORBIDDEN:
 """
 
     def chat(self, message: str, student_id: str = "demo_student",
-             context: Optional[Dict] = None, language: str = "en") -> Dict:
+             context: Optional[Dict] = None, language: str = "en",
+             tenant_id: Optional[str] = None) -> Dict:
         """
         Process a chat message with RAG retrieval and session memory.
+        Retrieval uses the knowledge base of `tenant_id` (default: the default campus);
+        an unknown tenant raises tenant_registry.UnknownTenantError.
+        """
+        turn = self._prepare_turn(message, student_id, context, language, tenant_id)
+        if "result" in turn:
+            return turn["result"]
+
+        cached = self._cached_answer(turn)
+        if cached is not None:
+            return self._finish_turn(student_id, cached, turn)
+
+        # 7. Call Ollama with optimized config (joining an identical in-flight call if there is one)
+        try:
+            ai_text = self.inflight.do(("chat", turn["cache_key"]), self._generate_answer, turn)
+
+        except OllamaUnavailable:
+            ai_text = self._get_offline_response(language)
+        except Exception as e:
+            print(f"LLM error: {e}")
+            ai_text = self._fallback_response(turn["intent"], language)
+
+        return self._finish_turn(student_id, ai_text, turn)
+
+    def chat_stream(self, message: str, student_id: str = "demo_student",
+                    context: Optional[Dict] = None, language: str = "en",
+                    tenant_id: Optional[str] = None) -> Iterator[Dict]:
+        """
+        chat(), streamed: yields {"event": "token", "token": ...} as Ollama produces
+        them, then one {"event": "done", ...} carrying the final (deduplicated)
+        response, message id, sources and time-to-first-token. The session is
+        written only when the stream ends.
         """
+        start = time.perf_counter()
+        turn = self._prepare_turn(message, student_id, context, language, tenant_id)
+        if "result" in turn:
+            yield {"event": "token", "token": turn["result"]["response"]}
+            yield {"event": "done", **turn["result"], "ttft": round(time.perf_counter() - start, 3)}
+            return
+
+        cached = self._cached_answer(turn)
+        if cached is not None:
+            yield {"event": "token", "token": cached}
+            yield {"event": "done", **self._finish_turn(student_id, cached, turn),
+                   "ttft": round(time.perf_counter() - start, 3)}
+            return
+
+        flight_key = ("chat", turn["cache_key"])
+        call, leader = self.inflight.begin(flight_key)
+        if not leader:
+            # The same prompt is already being generated for another request: wait for its answer
+            try:
+                ai_text = self.inflight.wait(call) or self._fallback_response(turn["intent"], language)
+            except OllamaUnavailable:
+                ai_text = self._get_offline_response(language)
+            except Exception:
+                ai_text = self._fallback_response(turn["intent"], language)
+            yield {"event": "token", "token": ai_text}
+            yield {"event": "done", **self._finish_turn(student_id, ai_text, turn),
+                   "ttft": round(time.perf_counter() - start, 3)}
+            return
+
+        parts: List[str] = []
+        ttft = None
+        answer, error = None, None
+        try:
+            # Ollama streams NDJSON: one {"response": <token>, "done": bool} per line
+            for chunk in self.llm.stream_generate(turn["prompt"], caller="chat_stream",
+                                                  system=self.system_prompt, options=CHAT_OPTIONS,
+                                                  model=self.model):
+                token = chunk.get("response", "")
+                if token:
+                    if ttft is None:
+                        ttft = round(time.perf_counter() - start, 3)
+                    parts.append(token)
+                    yield {"event": "token", "token": token}
+            answer = self._deduplicate_response("".join(parts).strip())
+            if answer:
+                self._cache_answer(turn, answer)
+            ai_text = answer or self._fallback_response(turn["intent"], language)
+
+        except OllamaUnavailable as e:
+            error = e
+            ai_text = "".join(parts).strip() or self._get_offline_response(language)
+        except Exception as e:
+            error = e
+            print(f"LLM stream error: {e}")
+            ai_text = "".join(parts).strip() or self._fallback_response(turn["intent"], language)
+        finally:
+            # Also runs when the client disconnects mid-stream, so waiting requests are released
+            if answer is None and error is None:
+                error = RuntimeError("stream ended before the answer was complete")
+            self.inflight.finish(flight_key, call, answer, error)
+
+        if not parts:
+            # Nothing was streamed (Ollama offline or failed): send the fallback text as one token
+            ttft = round(time.perf_counter() - start, 3)
+            yield {"event": "token", "token": ai_text}
+
+        yield {"event": "done", **self._finish_turn(student_id, ai_text, turn), "ttft": ttft}
+
+    def _prepare_turn(self, message: str, student_id: str, context: Optional[Dict],
+                      language: str, tenant_id: Optional[str]) -> Dict:
+        """
+        Steps shared by chat() and chat_stream() up to the LLM call. Returns the
+        turn state with the assembled 'prompt', or with the final 'result' when
+        the question is escalated to human support.
+        """
+        rag = self.tenants.get(tenant_id) if tenant_id else self.rag
+
         # 1. Store user message in session
         self.sessions.add_message(student_id, "user", message)
 
         # 2. Detect intent for smart routing
         intent = self.extract_intent(message)
 
+        # Students in an A/B test consistently get the candidate index version
+        index_version = rag.ab_version(student_id)
+        turn = {"intent": intent, "rag_results": [], "language": language, "message": message,
+                "name": context.get('name', 'Student') if context else 'Student',
+                "ab_version": index_version, "index_version": index_version or rag.active_version,
+                "tenant": tenant_id or self.tenants.default_tenant,
+                "kb_fingerprint": rag.index_fingerprint(index_version),
+                "cohort": self._cohort(context)}
+
+        # A close paraphrase of a recently answered question reuses that answer.
+        # Complaints skip the cache and go on to escalation; follow-ups skip it
+        # because their answer depends on this student's conversation
+        follow_up = len(self.sessions.get_context_window(student_id, max_turns=5)) > 1
+        hit = None if follow_up or self._is_complaint(message) else self._semantic_lookup(rag, turn)
+        if hit is not None:
+            turn["intent"], turn["sources"], turn["cached"] = hit["intent"] or intent, hit["sources"], True
+            turn["result"] = self._finish_turn(student_id, hit["response"], turn)
+            return turn
+
         # 3. RAG retrieval — find relevant knowledge
-        rag_results = self.rag.search(message, top_k=5)
+        rag_results = self._retrieve(message, intent, version=index_version, rag=rag)
         knowledge_context = self._format_rag_context(rag_results)
+        turn["rag_results"] = rag_results
 
         # 4. Smart Fallback Detection
         if self._should_fallback(message, rag_results, intent):
-            name = context.get('name', 'Student') if context else 'Student'
+            name = turn["name"]
             
             # Use translation if available, otherwise fallback to English
             fallback_template = TRANSLATIONS["escalation"].get(language, TRANSLATIONS["escalation"]["en"])
             response_text = fallback_template.format(name=name)
             
             ai_msg_id = self.sessions.add_message(student_id, "ai", response_text)
-            return {
+            turn["result"] = {
                 "response": response_text,
                 "message_id": ai_msg_id,
                 "sources": ["human_support"],
@@ -135,65 +290,102 @@ FORBIDDEN:
                 "fallback": True,
                 "admin_escalation": True
             }
+            return turn
 
         # 5. Build conversation history
         conversation_history = self.sessions.get_context_window(student_id, max_turns=5)
 
         # 6. Build the full prompt
-        full_prompt = self._build_prompt(
+        turn["prompt"] = self._build_prompt(
             message=message,
             student_context=context,
             knowledge_context=knowledge_context,
             conversation_history=conversation_history,
             language=language,
         )
-
-        # 7. Call Ollama with optimized config
+        return turn
+
+    def _generate_answer(self, turn: Dict) -> str:
+        """One Ollama generation for the turn's prompt; successful answers are cached."""
+        result = self.llm.generate(turn["prompt"], caller="chat", system=self.system_prompt,
+                                   options=CHAT_OPTIONS, model=self.model)
+        ai_text = self._deduplicate_response(result.get("response", "Internal error.").strip())
+        if ai_text:
+            self._cache_answer(turn, ai_text)
+        return ai_text
+
+    def _cached_answer(self, turn: Dict) -> Optional[str]:
+        """A stored answer to this exact prompt, or None."""
+        turn["cache_key"] = self.response_cache.make_key(self.model, self.system_prompt,
+                                                         turn["prompt"], CHAT_OPTIONS)
+        answer = self.response_cache.get(turn["cache_key"], turn["tenant"], turn["kb_fingerprint"])
+        turn["cached"] = answer is not None
+        return answer
+
+    def _cache_answer(self, turn: Dict, ai_text: str):
+        """Store a successful LLM answer (fallback and offline texts are never cached)."""
+        self.response_cache.put(turn["cache_key"], ai_text, turn["tenant"], turn["kb_fingerprint"])
+        if turn.get("question_vector") is not None:
+            self.semantic_cache.add(turn["question_vector"], turn["message"], ai_text, turn["name"],
+                                    turn["tenant"], turn["language"], turn["kb_fingerprint"],
+                                    sources=self._sources(turn), intent=turn["intent"],
+                                    cohort=turn["cohort"])
+
+    def _semantic_lookup(self, rag, turn: Dict) -> Optional[Dict]:
+        """Embed the question with the RAG embedder and look for a cached paraphrase."""
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": full_prompt,
-                    "system": self.system_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,  # Fast and consistent
-                        "top_p": 0.9,
-                        "num_predict": 100,  # Force short responses (Fix #4)
-                        "num_ctx": 2048,     # Optimized context window
-                        "stop": ["\n\n", "4.", "5."], # Stop after 3 points (Fix #4)
-                    },
-                },
-                timeout=30,
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                ai_text = result.get("response", "Internal error.").strip()
-                ai_text = self._deduplicate_response(ai_text)
-            else:
-                ai_text = self._fallback_response(intent, language)
-
-        except requests.exceptions.ConnectionError:
-            ai_text = self._get_offline_response(language)
+            vectors = rag.embed_queries([turn["message"]], version=turn["ab_version"])
         except Exception as e:
-            print(f"LLM error: {e}")
-            ai_text = self._fallback_response(intent, language)
-
+            print(f"Semantic cache embed error: {e}")
+            return None
+        if vectors is None:
+            return None  # dense retrieval still loading: no embedder yet
+        turn["question_vector"] = vectors[0]
+        return self.semantic_cache.lookup(vectors[0], turn["name"], turn["tenant"],
+                                          turn["language"], turn["kb_fingerprint"], turn["cohort"])
+
+    @staticmethod
+    def _cohort(context: Optional[Dict]) -> str:
+        """Department and year: the student details besides the name that shape an answer."""
+        context = context or {}
+        return f"{context.get('department', 'Information Technology')}/{context.get('year', 'First Year')}"
+
+    def _sources(self, turn: Dict) -> List[str]:
+        """Categories the answer drew on (carried over from the original turn on a semantic hit)."""
+        if "sources" in turn:
+            return turn["sources"]
+        return list({r["category"] for r in turn["rag_results"] if r.get("score", 0) > 0.4})
+
+    def _finish_turn(self, student_id: str, ai_text: str, turn: Dict) -> Dict:
         # 8. Store AI response in session
         ai_msg_id = self.sessions.add_message(student_id, "ai", ai_text)
 
         # 9. Extract sources
-        sources = [r["category"] for r in rag_results if r.get("score", 0) > 0.4]
+        sources = self._sources(turn)
 
         return {
             "response": ai_text,
             "message_id": ai_msg_id,
-            "sources": list(set(sources)),
-            "intent": intent,
+            "sources": sources,
+            "intent": turn["intent"],
+            "index_version": turn["index_version"],
+            "cached": turn.get("cached", False),
         }
 
+    def _retrieve(self, message: str, intent: str, top_k: int = 5,
+                  version: Optional[int] = None, rag=None) -> List[Dict]:
+        """
+        Search the partition matching the detected intent first and widen to the
+        whole knowledge base only when that partition has no strong hit.
+        """
+        rag = rag or self.rag
+        if intent in rag.categories():
+            results = rag.search(message, top_k=top_k, mode="hybrid", category=intent, version=version)
+            if results and max(r.get("score", 0) for r in results) >= PARTITION_MIN_SCORE:
+                return results
+
+        return rag.search(message, top_k=top_k, mode="hybrid", version=version)
+
     def _should_fallback(self, query: str, rag_results: List[Dict], intent: str) -> bool:
         """Decide if query needs human support."""
         # Only fallback if RAG returns nothing at all
@@ -201,12 +393,16 @@ FORBIDDEN:
             return True
 
         # Sensitive topics & Complaints
-        complaints = ['complaint', 'issue', 'problem', 'wrong', 'rejected', 'error', 'stuck', 'missing', 'lost']
-        if any(word in query.lower() for word in complaints):
+        if self._is_complaint(query):
             return True
 
         return False
 
+    @staticmethod
+    def _is_complaint(query: str) -> bool:
+        complaints = ['complaint', 'issue', 'problem', 'wrong', 'rejected', 'error', 'stuck', 'missing', 'lost']
+        return any(word in query.lower() for word in complaints)
+
     def _build_prompt(self, message: str, student_context: Optional[Dict],
                       knowledge_context: str, conversation_history: List[Dict],
                       language: str) -> str:
@@ -400,21 +596,12 @@ Return ONLY a JSON array, no other text:
 The answer field is the index (0-3) of the correct option."""
 
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"temperature": 0.5},
-                },
-                timeout=60,
-            )
-            if response.status_code == 200:
-                raw = response.json().get("response", "[]")
-                start, end = raw.find("["), raw.rfind("]") + 1
-                if start != -1 and end > start:
-                    return json.loads(raw[start:end])
+            # Students opening the same quiz together share one generation
+            raw = self.inflight.do(("quiz", self.model, prompt), lambda: self.llm.generate(
+                prompt, caller="quiz", options={"temperature": 0.5}, model=self.model).get("response", "[]"))
+            start, end = raw.find("["), raw.rfind("]") + 1
+            if start != -1 and end > start:
+                return json.loads(raw[start:end])
         except Exception as e:
             print(f"Quiz error: {e}")
 
@@ -445,21 +632,17 @@ The answer field is the index (0-3) of the correct option."""
         
         # 3. Call LLM
         try:
-            response = requests.post(
-                f"{self.base_url}/api/chat", 
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": message}
-                    ],
-                    "stream": False,
-                    "options": {"temperature": 0.3} # Lower temp for more stable advice
-                }, 
-                timeout=30
+            response = self.llm.chat(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                caller="mental_health",
+                options={"temperature": 0.3}, # Lower temp for more stable advice
+                model=self.model,
             )
             
-            ai_message = response.json()['message']['content']
+            ai_message = response['message']['content']
             
             return {
                 "response": ai_message,
@@ -476,16 +659,14 @@ The answer field is the index (0-3) of the correct option."""
     def check_health(self) -> Dict:
         """Check if Ollama is running and model is available."""
         try:
-            resp = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if resp.status_code == 200:
-                models = [m["name"] for m in resp.json().get("models", [])]
-                model_loaded = any(self.model in m for m in models)
-                return {
-                    "ollama": "online",
-                    "model": self.model,
-                    "model_loaded": model_loaded,
-                    "available_models": models,
-                }
+            models = self.llm.list_models(caller="health")
+            model_loaded = any(self.model in m for m in models)
+            return {
+                "ollama": "online",
+                "model": self.model,
+                "model_loaded": model_loaded,
+                "available_models": models,
+            }
         except Exception:
             pass
 
@@ -526,6 +707,7 @@ if __name__ == "__main__":
 
     # Test 3: RAG search
     print("\nTest 3: RAG Search")
+    agent.rag.wait_until_ready()
     results = agent.rag.search("What documents do I need for admission?")
     print(f"  Found {len(results)} results")
     for r in results:
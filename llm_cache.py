@@ -0,0 +1,245 @@
+"""
+LLM Response Cache — exact-match answers for repeated prompts, in memory and in SQLite
+Keyed by a hash of (model, system prompt, prompt, options); entries expire after a TTL,
+the oldest are evicted past a size bound, and each tenant keeps entries for its live knowledge-base generations
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")  # "" keeps the cache in memory only
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+
+# Past the size bound, evict down to this share of it so eviction runs in batches
+EVICT_TO = 0.9
+
+# Knowledge-base generations served at once per scope: the active index and an A/B candidate
+LIVE_GENERATIONS = 2
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM responses.
+
+    - Memory: the `memory_entries` most recently used answers (LRU).
+    - SQLite: up to `max_entries` answers that survive restarts; the least
+      recently used are evicted in batches once the bound is passed.
+
+    Entries belong to a `scope` (a tenant) and were produced against a
+    `generation` of its knowledge base; they are only served for that
+    generation. A scope keeps its LIVE_GENERATIONS most recently used
+    generations, so an A/B test can alternate between two without either
+    evicting the other; the entries of a generation that drops out of that set
+    are deleted, in memory and on disk.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_entries: Optional[int] = None, memory_entries: Optional[int] = None):
+        self.db_path = CACHE_PATH if db_path is None else db_path
+        self.ttl_seconds = TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.memory_entries = MEMORY_ENTRIES if memory_entries is None else memory_entries
+
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()  # (scope, generation, key) -> (response, created_at)
+        self._generations: Dict[str, "OrderedDict[str, None]"] = {}  # scope -> live generations, LRU order
+        self._lock = threading.Lock()
+        self.stats_counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                               "writes": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+        self.conn = None
+        self._disk_entries = 0
+        if self.db_path:
+            try:
+                self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                columns = {row[1]: row[5] for row in self.conn.execute("PRAGMA table_info(llm_responses)")}
+                if columns and not columns.get("generation"):
+                    # Older caches were keyed by (scope, key) alone; they only hold regenerable answers
+                    self.conn.execute("DROP TABLE llm_responses")
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_responses (
+                        scope TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        generation TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL,
+                        PRIMARY KEY (scope, generation, key)
+                    )
+                """)
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses(last_used)")
+                self.conn.commit()
+                self._disk_entries = self.conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"⚠️  LLM cache falling back to memory only ({self.db_path}): {e}")
+                self.conn = None
+
+    @staticmethod
+    def make_key(model: str, system: Optional[str], prompt: str, options: Optional[Dict] = None) -> str:
+        """Stable hash of everything that decides the generation."""
+        payload = json.dumps([model, system or "", prompt, options or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, scope: str = "default", generation: str = "") -> Optional[str]:
+        """The cached response, or None on a miss (absent, expired or from another generation)."""
+        now = time.time()
+        entry_key = (scope, generation, key)
+        with self._lock:
+            self._observe(scope, generation)
+            entry = self._memory.get(entry_key)
+            if entry is not None:
+                response, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(entry_key)
+                    self.stats_counters["memory_hits"] += 1
+                    return response
+                del self._memory[entry_key]
+
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT response, created_at FROM llm_responses WHERE scope = ? AND generation = ? AND key = ?",
+                    entry_key,
+                ).fetchone()
+                if row is not None:
+                    response, created_at = row
+                    if not self._expired(created_at, now):
+                        self.conn.execute("UPDATE llm_responses SET last_used = ? "
+                                          "WHERE scope = ? AND generation = ? AND key = ?", (now, *entry_key))
+                        self.conn.commit()
+                        self._remember(entry_key, response, created_at)
+                        self.stats_counters["disk_hits"] += 1
+                        return response
+                    self._delete_rows("scope = ? AND generation = ? AND key = ?", entry_key)
+                    self.stats_counters["expired"] += 1
+
+            self.stats_counters["misses"] += 1
+            return None
+
+    def put(self, key: str, response: str, scope: str = "default", generation: str = ""):
+        now = time.time()
+        with self._lock:
+            self._observe(scope, generation)
+            self._remember((scope, generation, key), response, now)
+            self.stats_counters["writes"] += 1
+            if self.conn is None:
+                return
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO llm_responses (scope, key, generation, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, key, generation, response, now, now),
+            ).rowcount
+            if not inserted:
+                self.conn.execute(
+                    "UPDATE llm_responses SET response = ?, created_at = ?, last_used = ? "
+                    "WHERE scope = ? AND generation = ? AND key = ?",
+                    (response, now, now, scope, generation, key),
+                )
+            self._disk_entries += inserted
+            if self._disk_entries > self.max_entries:
+                self._evict(now)
+            self.conn.commit()
+
+    def invalidate(self, scope: Optional[str] = None, generation: Optional[str] = None) -> int:
+        """
+        Drop the entries of `scope` (every scope if None) produced against
+        `generation` (any generation if None). Returns the number dropped.
+        """
+        with self._lock:
+            if scope is None:
+                self._generations.clear()
+            elif generation is None:
+                self._generations.pop(scope, None)
+            else:
+                self._generations.get(scope, {}).pop(generation, None)
+            return self._invalidate(scope, generation)
+
+    def clear(self) -> int:
+        return self.invalidate()
+
+    def _observe(self, scope: str, generation: str):
+        """Mark `generation` live for `scope`; the least recently used one past LIVE_GENERATIONS is dropped."""
+        live = self._generations.setdefault(scope, OrderedDict())
+        if generation in live:
+            live.move_to_end(generation)
+            return
+        live[generation] = None
+        while len(live) > LIVE_GENERATIONS:
+            self._invalidate(scope, live.popitem(last=False)[0])
+
+    def _invalidate(self, scope: Optional[str], generation: Optional[str]) -> int:
+        stale = [k for k in self._memory
+                 if (scope is None or k[0] == scope) and (generation is None or k[1] == generation)]
+        for k in stale:
+            del self._memory[k]
+
+        dropped = len(stale)
+        if self.conn is not None:
+            clauses, params = [], []
+            if scope is not None:
+                clauses.append("scope = ?")
+                params.append(scope)
+            if generation is not None:
+                clauses.append("generation = ?")
+                params.append(generation)
+            dropped = self._delete_rows(" AND ".join(clauses) or "1", tuple(params))
+            self.conn.commit()
+        self.stats_counters["invalidations"] += dropped
+        return dropped
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _remember(self, entry_key: tuple, response: str, created_at: float):
+        if self.memory_entries <= 0:
+            return
+        self._memory[entry_key] = (response, created_at)
+        self._memory.move_to_end(entry_key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _delete_rows(self, where: str, params: tuple) -> int:
+        deleted = self.conn.execute(f"DELETE FROM llm_responses WHERE {where}", params).rowcount
+        self._disk_entries = max(0, self._disk_entries - deleted)
+        return deleted
+
+    def _evict(self, now: float):
+        """Drop expired rows, then the least recently used ones down to EVICT_TO of the bound."""
+        if self.ttl_seconds > 0:
+            self.stats_counters["expired"] += self._delete_rows("created_at < ?", (now - self.ttl_seconds,))
+        excess = self._disk_entries - int(self.max_entries * EVICT_TO)
+        if excess > 0:
+            self.stats_counters["evictions"] += self._delete_rows(
+                "rowid IN (SELECT rowid FROM llm_responses ORDER BY last_used ASC LIMIT ?)", (excess,))
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            memory_size = len(self._memory)
+            disk_size = self._disk_entries
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        total = hits + counters["misses"]
+        return {
+            "backend": "sqlite" if self.conn is not None else "memory",
+            "path": self.db_path or None,
+            "memory_entries": memory_size,
+            "disk_entries": disk_size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            **counters,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,234 @@
+"""
+Ollama Client — one pooled connection to the local Ollama server for every LLM caller
+Central base URL, model and timeout config plus per-caller call/latency metrics
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:4b")
+
+# Per-caller model overrides; OLLAMA_MODEL_<CALLER> (e.g. OLLAMA_MODEL_TAGLINE) wins
+CALLER_MODELS = {
+    "tagline": "llama3.2",
+}
+
+# Read timeout (seconds) per caller: how long a generation may take end to end
+CALLER_TIMEOUTS = {
+    "chat": 30,
+    "chat_stream": 30,  # longest gap between streamed tokens
+    "quiz": 60,
+    "mental_health": 30,
+    "document": 30,
+    "roommate": 10,
+    "roommate_summary": 12,
+    "tagline": 15,
+    "health": 5,
+}
+DEFAULT_TIMEOUT = 30
+CONNECT_TIMEOUT = 3.0
+
+# Keep-alive connections held open to Ollama (concurrent requests beyond this wait)
+POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+
+# Latency samples kept per caller for percentiles
+LATENCY_WINDOW = 512
+
+
+class OllamaError(Exception):
+    """Ollama answered with an error status or an unreadable body."""
+
+
+class OllamaUnavailable(OllamaError):
+    """Ollama could not be reached (not running or refusing connections)."""
+
+
+class OllamaClient:
+    """
+    Thread-safe client over one requests.Session: connections to Ollama are
+    kept alive and reused instead of a new TCP handshake per call.
+
+    Every call names its `caller` ("chat", "quiz", "tagline", ...), which picks
+    the model and timeout and files the latency under that caller in stats().
+    The a*-methods run the same pooled call on a worker thread for async routes.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None,
+                 pool_size: int = POOL_SIZE):
+        self.base_url = (base_url or OLLAMA_URL).rstrip("/")
+        self.model = model or DEFAULT_MODEL
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict] = {}
+
+    def model_for(self, caller: str) -> str:
+        return os.getenv(f"OLLAMA_MODEL_{caller.upper()}") or CALLER_MODELS.get(caller) or self.model
+
+    @staticmethod
+    def timeout_for(caller: str) -> float:
+        return CALLER_TIMEOUTS.get(caller, DEFAULT_TIMEOUT)
+
+    # ---------- calls ----------
+
+    def generate(self, prompt: str, caller: str = "default", system: Optional[str] = None,
+                 options: Optional[Dict] = None, format: Optional[str] = None,
+                 model: Optional[str] = None, timeout: Optional[float] = None) -> Dict:
+        """POST /api/generate (non-streaming); returns Ollama's JSON (text in 'response')."""
+        body = self._generate_body(prompt, caller, system, options, format, model, stream=False)
+        return self._post("/api/generate", body, caller, timeout)
+
+    def chat(self, messages: List[Dict], caller: str = "default", options: Optional[Dict] = None,
+             model: Optional[str] = None, timeout: Optional[float] = None) -> Dict:
+        """POST /api/chat (non-streaming); the reply is in ['message']['content']."""
+        body = {"model": model or self.model_for(caller), "messages": messages, "stream": False}
+        if options:
+            body["options"] = options
+        return self._post("/api/chat", body, caller, timeout)
+
+    def stream_generate(self, prompt: str, caller: str = "default", system: Optional[str] = None,
+                        options: Optional[Dict] = None, model: Optional[str] = None,
+                        timeout: Optional[float] = None) -> Iterator[Dict]:
+        """POST /api/generate with stream=True; yields each NDJSON chunk as it arrives."""
+        body = self._generate_body(prompt, caller, system, options, None, model, stream=True)
+        start = time.perf_counter()
+        ttft = None
+        error = None
+        try:
+            with self._request("POST", "/api/generate", caller, timeout, json=body, stream=True) as response:
+                self._check(response)
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if ttft is None and chunk.get("response"):
+                        ttft = time.perf_counter() - start
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also reached when the consumer stops early (client disconnected)
+            self._record(caller, start, error, ttft)
+
+    def list_models(self, caller: str = "health", timeout: Optional[float] = None) -> List[str]:
+        """Names of the models pulled into Ollama (GET /api/tags)."""
+        start = time.perf_counter()
+        try:
+            response = self._request("GET", "/api/tags", caller, timeout)
+            self._check(response)
+            models = [m["name"] for m in response.json().get("models", [])]
+        except Exception as e:
+            self._record(caller, start, e)
+            raise
+        self._record(caller, start)
+        return models
+
+    async def agenerate(self, prompt: str, caller: str = "default", **kwargs) -> Dict:
+        """generate() for async routes, without blocking the event loop."""
+        return await asyncio.to_thread(self.generate, prompt, caller, **kwargs)
+
+    async def achat(self, messages: List[Dict], caller: str = "default", **kwargs) -> Dict:
+        return await asyncio.to_thread(self.chat, messages, caller, **kwargs)
+
+    # ---------- plumbing ----------
+
+    def _generate_body(self, prompt, caller, system, options, format, model, stream: bool) -> Dict:
+        body = {"model": model or self.model_for(caller), "prompt": prompt, "stream": stream}
+        if system:
+            body["system"] = system
+        if options:
+            body["options"] = options
+        if format:
+            body["format"] = format
+        return body
+
+    def _request(self, method: str, path: str, caller: str, timeout: Optional[float], **kwargs):
+        read_timeout = timeout or self.timeout_for(caller)
+        try:
+            return self.session.request(method, f"{self.base_url}{path}",
+                                        timeout=(min(CONNECT_TIMEOUT, read_timeout), read_timeout), **kwargs)
+        except requests.exceptions.ConnectionError as e:  # includes connect timeouts
+            raise OllamaUnavailable(str(e)) from e
+        except requests.exceptions.Timeout as e:
+            raise OllamaError(f"Ollama timed out after {read_timeout}s") from e
+
+    @staticmethod
+    def _check(response):
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama returned HTTP {response.status_code}: {response.text[:200]}")
+
+    def _post(self, path: str, body: Dict, caller: str, timeout: Optional[float]) -> Dict:
+        start = time.perf_counter()
+        try:
+            response = self._request("POST", path, caller, timeout, json=body)
+            self._check(response)
+            try:
+                result = response.json()
+            except ValueError as e:
+                raise OllamaError(f"Unreadable Ollama response: {e}") from e
+        except Exception as e:
+            self._record(caller, start, e)
+            raise
+        self._record(caller, start)
+        return result
+
+    def _record(self, caller: str, start: float, error: Optional[Exception] = None,
+                ttft: Optional[float] = None):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            m = self._metrics.get(caller)
+            if m is None:
+                m = self._metrics[caller] = {"calls": 0, "errors": 0, "last_error": None,
+                                             "latencies": deque(maxlen=LATENCY_WINDOW),
+                                             "ttfts": deque(maxlen=LATENCY_WINDOW)}
+            m["calls"] += 1
+            m["latencies"].append(elapsed_ms)
+            if ttft is not None:
+                m["ttfts"].append(ttft * 1000)
+            if error is not None:
+                m["errors"] += 1
+                m["last_error"] = f"{type(error).__name__}: {error}"[:200]
+
+    @staticmethod
+    def _percentile(values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))], 1)
+
+    def stats(self) -> Dict:
+        """Calls, errors and latency percentiles (ms) per caller."""
+        with self._lock:
+            snapshot = {caller: (dict(m), list(m["latencies"]), list(m["ttfts"]))
+                        for caller, m in self._metrics.items()}
+        report = {}
+        for caller, (m, latencies, ttfts) in sorted(snapshot.items()):
+            report[caller] = {
+                "calls": m["calls"],
+                "errors": m["errors"],
+                "p50_ms": self._percentile(latencies, 50),
+                "p95_ms": self._percentile(latencies, 95),
+                "max_ms": round(max(latencies), 1) if latencies else 0.0,
+                "last_error": m["last_error"],
+            }
+            if ttfts:
+                report[caller]["ttft_p50_ms"] = self._percentile(ttfts, 50)
+        return {"base_url": self.base_url, "model": self.model, "callers": report}
+
+
+# Shared by the agent, document processor, roommate matcher and server routes
+ollama_instance = OllamaClient()
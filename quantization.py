@@ -0,0 +1,132 @@
+"""
+Quantization — compact embedding codes for the NumPy vector store
+Int8 scalar quantization and product quantization, both scored with asymmetric
+distance computation (float query against quantized corpus codes)
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# Rows scored per block, so the float copy of the codes stays small
+SCORE_BLOCK = 65536
+
+
+class Int8Quantizer:
+    """
+    Symmetric per-dimension scalar quantization: x ≈ scale * code, code in [-127, 127].
+    Codes take 1 byte per dimension (a quarter of float32).
+    """
+
+    name = "int8"
+
+    def __init__(self):
+        self.scale: Optional[np.ndarray] = None
+
+    def fit(self, matrix: np.ndarray):
+        peak = np.abs(matrix).max(axis=0)
+        peak[peak == 0] = 1.0
+        self.scale = (peak / 127.0).astype(np.float32)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products, shape (queries, rows)."""
+        scaled = queries * self.scale  # fold the scale into the query once
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK):
+            block = np.asarray(codes[start:start + SCORE_BLOCK], dtype=np.float32)
+            out[:, start:start + SCORE_BLOCK] = scaled @ block.T
+        return out
+
+    def state(self) -> np.ndarray:
+        return self.scale
+
+    def load(self, state: np.ndarray):
+        self.scale = np.asarray(state, dtype=np.float32)
+
+
+class ProductQuantizer:
+    """
+    Splits each vector into `subspaces` slices and stores the id of the nearest
+    of up to 256 k-means centroids per slice: `subspaces` bytes per vector.
+    Queries build a (subspace, centroid) inner-product table and sum lookups.
+    """
+
+    name = "pq"
+
+    def __init__(self, subspaces: int = 16, centroids: int = 256, iterations: int = 12,
+                 sample_size: int = 20000, seed: int = 0):
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.iterations = iterations
+        self.sample_size = sample_size
+        self.seed = seed
+        self.codebook: Optional[np.ndarray] = None  # (subspaces, centroids, sub_dim)
+
+    def _split(self, matrix: np.ndarray) -> np.ndarray:
+        m = self.codebook.shape[0]
+        return matrix.reshape(len(matrix), m, -1)
+
+    def fit(self, matrix: np.ndarray):
+        dim = matrix.shape[1]
+        # Largest subspace count <= the requested one that divides the dimension
+        m = next(s for s in range(min(self.subspaces, dim), 0, -1) if dim % s == 0)
+        rng = np.random.default_rng(self.seed)
+        sample = matrix
+        if len(matrix) > self.sample_size:
+            sample = matrix[rng.choice(len(matrix), self.sample_size, replace=False)]
+        k = min(self.centroids, len(sample))
+
+        slices = sample.reshape(len(sample), m, -1)
+        codebook = np.empty((m, k, slices.shape[2]), dtype=np.float32)
+        for j in range(m):
+            codebook[j] = self._kmeans(slices[:, j, :], k, rng)
+        self.codebook = codebook
+
+    def _kmeans(self, points: np.ndarray, k: int, rng) -> np.ndarray:
+        centers = points[rng.choice(len(points), k, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = self._nearest(points, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assign, points)
+            counts = np.bincount(assign, minlength=k)
+            filled = counts > 0  # empty clusters keep their previous center
+            centers[filled] = sums[filled] / counts[filled, None]
+        return centers
+
+    @staticmethod
+    def _nearest(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2 * points @ centers.T
+        return distances.argmin(axis=1)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        slices = self._split(matrix)
+        codes = np.empty((len(matrix), self.codebook.shape[0]), dtype=np.uint8)
+        for j in range(self.codebook.shape[0]):
+            codes[:, j] = self._nearest(slices[:, j, :], self.codebook[j])
+        return codes
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products, shape (queries, rows), via table lookups."""
+        tables = np.einsum("qmd,mkd->qmk", self._split(queries), self.codebook)
+        out = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.codebook.shape[0]):
+            out += tables[:, j, :][:, np.asarray(codes[:, j], dtype=np.intp)]
+        return out
+
+    def state(self) -> np.ndarray:
+        return self.codebook
+
+    def load(self, state: np.ndarray):
+        self.codebook = np.asarray(state, dtype=np.float32)
+
+
+QUANTIZERS = {"int8": Int8Quantizer, "pq": ProductQuantizer}
+
+
+def make_quantizer(kind: str):
+    if kind not in QUANTIZERS:
+        raise ValueError(f"quantization must be one of {tuple(QUANTIZERS)}")
+    return QUANTIZERS[kind]()
@@ -0,0 +1,121 @@
+"""
+RAG Benchmark — retrieval quality and latency for every RAGEngine search mode
+Runs a labelled query set and reports recall@k, MRR and latency percentiles as JSON
+"""
+
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+from typing import List, Dict, Optional
+
+from rag_engine import RAGEngine, SEARCH_MODES, STORES
+
+DEFAULT_QUERY_SET = Path(__file__).parent / "rag_benchmark_queries.json"
+RECALL_AT = (1, 3, 5)
+
+
+def load_query_set(path: Path = DEFAULT_QUERY_SET) -> List[Dict]:
+    """
+    Load labelled queries. Each entry has a 'query', the expected 'category'
+    and optionally a 'section' (heading text) or 'id' that the hit must match.
+    """
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def is_relevant(result: Dict, label: Dict) -> bool:
+    if label.get("id"):
+        return result.get("id") == label["id"]
+    if result.get("category") != label["category"]:
+        return False
+    section = label.get("section")
+    return not section or section.lower() in result.get("text", "").lower()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def evaluate_mode(engine: RAGEngine, queries: List[Dict], mode: str, repeat: int = 1,
+                  version: Optional[int] = None) -> Dict:
+    """Score one search mode over the query set."""
+    top_k = max(RECALL_AT)
+    hits = {k: 0 for k in RECALL_AT}
+    reciprocal_ranks = []
+    latencies_ms = []
+    misses = []
+
+    for label in queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = engine.search(label["query"], top_k=top_k, mode=mode, version=version)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+
+        rank = next((i + 1 for i, r in enumerate(results) if is_relevant(r, label)), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        for k in RECALL_AT:
+            if rank and rank <= k:
+                hits[k] += 1
+        if not rank or rank > 1:
+            misses.append({"query": label["query"], "rank": rank,
+                           "top": results[0]["id"] if results else None})
+
+    n = len(queries) or 1
+    report = {f"recall@{k}": round(hits[k] / n, 3) for k in RECALL_AT}
+    report["mrr"] = round(sum(reciprocal_ranks) / n, 3)
+    report["latency_ms"] = {
+        "p50": round(percentile(latencies_ms, 50), 3),
+        "p95": round(percentile(latencies_ms, 95), 3),
+        "p99": round(percentile(latencies_ms, 99), 3),
+    }
+    report["misses"] = misses
+    return report
+
+
+def run_benchmark(engine: RAGEngine, queries: List[Dict], modes: Optional[List[str]] = None,
+                  repeat: int = 1, version: Optional[int] = None) -> Dict:
+    """Evaluate each mode (against `version`, default the active one) and return the JSON report."""
+    modes = modes or list(SEARCH_MODES)
+    return {
+        "queries": len(queries),
+        "repeat": repeat,
+        "version": version or engine.active_version,
+        "engine": {k: v for k, v in engine.get_stats().items() if k != "cache"},
+        "modes": {mode: evaluate_mode(engine, queries, mode, repeat, version) for mode in modes},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAGEngine retrieval modes")
+    parser.add_argument("--queries", default=str(DEFAULT_QUERY_SET), help="Labelled query set (JSON)")
+    parser.add_argument("--modes", nargs="+", choices=SEARCH_MODES, default=list(SEARCH_MODES))
+    parser.add_argument("--store", choices=STORES, help="Default: RAG_STORE or chroma")
+    parser.add_argument("--knowledge-dir", default="knowledge_base")
+    parser.add_argument("--db-dir", default="chroma_db")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query")
+    parser.add_argument("--version", type=int, help="Stored index version to score (default: active)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Caches disabled so every timed search does the real work; queries run one at a
+    # time, so the micro-batching window would only add wait
+    engine = RAGEngine(knowledge_dir=args.knowledge_dir, db_dir=args.db_dir,
+                       store=args.store, cache_size=0, background=False, batch_wait_ms=0)
+    report = run_benchmark(engine, load_query_set(args.queries), args.modes, args.repeat, args.version)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text, encoding="utf-8")
+        print(f"📊 Benchmark report written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,25 @@
 """
-RAG Engine — ChromaDB-based retrieval for student onboarding knowledge
+RAG Engine — ChromaDB (or memory-mapped NumPy) retrieval for student onboarding knowledge
 Indexes markdown knowledge base files and performs semantic search
 """
 
 import os
+import importlib.util
+import json
+import shutil
+import time
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
 from typing import List, Dict, Optional
 
+from bm25_index import BM25Index
+from chunker import MarkdownChunker
+from embedding_batcher import EmbeddingBatcher
+from lru_cache import LRUCache
+
 try:
     import chromadb
     CHROMADB_AVAILABLE = True
@@ -15,12 +27,61 @@ except Exception:
     CHROMADB_AVAILABLE = False
     print("⚠️  chromadb not available. RAG will use keyword fallback.")
 
+# sentence-transformers pulls in torch, so it is only imported on the loader thread
+EMBEDDINGS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
 try:
-    from sentence_transformers import SentenceTransformer
-    EMBEDDINGS_AVAILABLE = True
+    from embeddings import EMBEDDING_BACKENDS, HashingEmbedder, load_backend, resolve_backend
+    EMBEDDING_BACKENDS_AVAILABLE = True
 except ImportError:
-    EMBEDDINGS_AVAILABLE = False
-    print("⚠️  sentence-transformers not installed. Using ChromaDB default embeddings.")
+    EMBEDDING_BACKENDS = ("auto",)
+    EMBEDDING_BACKENDS_AVAILABLE = False
+
+if not EMBEDDINGS_AVAILABLE:
+    if EMBEDDING_BACKENDS_AVAILABLE:
+        print("⚠️  sentence-transformers not installed. Using ONNX (if configured) or hashing embeddings.")
+    else:
+        print("⚠️  sentence-transformers not installed. Using ChromaDB default embeddings.")
+
+try:
+    from vector_store import NumpyVectorStore
+    NUMPY_STORE_AVAILABLE = True
+except ImportError:
+    NUMPY_STORE_AVAILABLE = False
+
+# Upper bound on records per collection write (Chroma rejects oversized batches)
+MAX_WRITE_BATCH = 4096
+
+# Vector stores accepted by RAGEngine(store=...): "numpy" is exact float16 search,
+# "int8" and "pq" are the numpy store over quantized codes
+STORES = ("chroma", "numpy", "int8", "pq")
+
+# Retrieval modes accepted by RAGEngine.search
+SEARCH_MODES = ("dense", "keyword", "hybrid")
+
+# Reciprocal rank fusion constant (Cormack et al. use 60)
+RRF_K = 60
+
+# Every index build is a versioned snapshot: Chroma collection campus_knowledge_v{n},
+# or index_dir/v{n} for the numpy stores (which also holds that version's manifest)
+COLLECTION_NAME = "campus_knowledge"
+
+# Version registry: the active pointer (flipped atomically after a build), pin flag,
+# A/B test and per-version build info
+VERSIONS_FILE = ".index_versions.json"
+
+# Index versions kept for rollback (the active and A/B versions are always kept)
+KEEP_VERSIONS = 3
+
+# Chunks pushed through add_documents(): they have no file to re-chunk, so they are kept
+# here and written into every full rebuild and every file-built keyword index
+MANUAL_FILE = ".manual_documents.json"
+
+# IDF weights of the hashing embedder, saved in the version directory of the vectors built with them
+HASHING_IDF_FILE = "hashing_idf.npy"
+
+# Seconds between knowledge base mtime polls in the background watcher
+WATCH_INTERVAL = 5.0
 
 
 class RAGEngine:
@@ -29,41 +90,122 @@ class RAGEngine:
     Indexes knowledge base documents and retrieves relevant chunks for LLM context.
     """
 
-    def __init__(self, knowledge_dir: str = "knowledge_base", db_dir: str = "chroma_db"):
+    def __init__(self, knowledge_dir: str = "knowledge_base", db_dir: str = "chroma_db",
+                 batch_size: int = 64, search_mode: str = "dense", cache_size: int = 1024,
+                 store: Optional[str] = None, background: bool = True,
+                 chunk_tokens: int = 160, chunk_overlap: int = 32,
+                 watch_interval: Optional[float] = None, rescore: int = 10,
+                 embedding_backend: Optional[str] = None, embedding_model_path: Optional[str] = None,
+                 batch_wait_ms: float = 5.0, keep_versions: int = KEEP_VERSIONS):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"search_mode must be one of {SEARCH_MODES}")
+        store = store or os.getenv("RAG_STORE", "chroma")
+        if store == "chroma" and not CHROMADB_AVAILABLE and NUMPY_STORE_AVAILABLE:
+            # Without chromadb, Chroma would leave retrieval keyword-only
+            print("⚠️  chromadb not available, using the numpy vector store")
+            store = "numpy"
+        if store not in STORES:
+            raise ValueError(f"store must be one of {STORES}")
+        # "auto", "sentence-transformers", "onnx" or "hashing"; the path is the ONNX
+        # model directory (or a sentence-transformers model name)
+        self.embedding_backend = embedding_backend or os.getenv("RAG_EMBEDDING_BACKEND", "auto")
+        self.embedding_model_path = embedding_model_path or os.getenv("RAG_EMBEDDING_MODEL_PATH")
+        if self.embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"embedding_backend must be one of {EMBEDDING_BACKENDS}")
         self.knowledge_dir = Path(knowledge_dir)
         self.db_dir = Path(db_dir)
+        self.store = store
+        # Version registry, per-version manifests and sidecars live next to the store they describe
+        self.index_dir = self.db_dir if store == "chroma" else self.db_dir / f"{store}_store"
+        self.rescore = rescore
+        self.batch_size = batch_size
+        self.chunker = MarkdownChunker(chunk_tokens=chunk_tokens, overlap_tokens=chunk_overlap)
+        self.search_mode = search_mode
         self.collection = None
         self.embedding_model = None
+        self.client = None
+
+        # Versioned snapshots: queries read self.collection (the active version) or,
+        # for A/B traffic, another kept version opened on demand
+        self.keep_versions = keep_versions
+        self.active_version: Optional[int] = None
+        self.pinned = False
+        self.ab_test: Optional[Dict] = None
+        self._versions_mtime: Optional[int] = None
+        self._snapshots: Dict[int, tuple] = {}  # version -> (collection, model, lexical index)
+        self.last_index_stats: Dict = {}
+        self.lexical_index: Optional[BM25Index] = None
+        self._lexical_hash: Optional[str] = None
+        self._search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-search")
+
+        # Caches are keyed by index generation; any index mutation bumps it
+        self.generation = 0
+        self._embedding_cache = LRUCache(cache_size)
+        self._search_cache = LRUCache(cache_size)
+
+        # Query encodes from concurrent requests are micro-batched on one worker thread;
+        # batch_wait_ms=0 encodes inline on the caller's thread instead
+        self._batcher = (EmbeddingBatcher(self._embed, max_batch=batch_size, max_wait_ms=batch_wait_ms)
+                         if batch_wait_ms > 0 else None)
         self._initialized = False
 
-        self._init_store()
+        # Dense retrieval becomes available once the model and index are loaded;
+        # until then search() is served by the BM25 index
+        self._ready = threading.Event()
+        self._loader: Optional[threading.Thread] = None
+
+        # Serializes index builds between the loader, the watcher and refresh() callers
+        self._index_lock = threading.RLock()
+        self._watcher: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self.watch_interval = watch_interval or WATCH_INTERVAL
+        self.watcher_stats: Dict = {"checks": 0, "refreshes": 0, "last_refresh": None, "last_error": None}
+
+        self._init_lexical_index()
+        if background:
+            self._loader = threading.Thread(target=self._load_dense, name="rag-loader", daemon=True)
+            self._loader.start()
+        else:
+            self._load_dense()
+        if watch_interval:
+            self.start_watcher(watch_interval)
+
+    def _load_dense(self):
+        """Load the embedding model and vector index, then enable dense search."""
+        start = time.perf_counter()
+        with self._index_lock:
+            self._init_store()
+        self._ready.set()
+        # Drop results cached while only the keyword path was available
+        self._bump_generation()
+        if self._initialized:
+            print(f"✅ Dense retrieval ready in {time.perf_counter() - start:.1f}s")
+
+    @property
+    def dense_ready(self) -> bool:
+        return self._ready.is_set() and self._initialized
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until background loading finishes; returns dense readiness."""
+        self._ready.wait(timeout)
+        return self.dense_ready
 
     def _init_store(self):
-        """Initialize ChromaDB and embedding model."""
+        """Initialize the vector store and embedding model."""
+        if self.store != "chroma":
+            self._init_numpy_store()
+            return
+
         if not CHROMADB_AVAILABLE:
             print("⚠️  RAG disabled — chromadb not available")
             return
 
         try:
-            # Initialize ChromaDB with persistent storage
-            self.client = chromadb.PersistentClient(path=str(self.db_dir))
-
-            # Load embedding model if available
-            if EMBEDDINGS_AVAILABLE:
-                print("📦 Loading embedding model (all-MiniLM-L6-v2)...")
-                self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-                self.collection = self.client.get_or_create_collection(
-                    name="campus_knowledge",
-                    metadata={"hnsw:space": "cosine"}
-                )
-            else:
-                # Use ChromaDB's default embeddings
-                self.collection = self.client.get_or_create_collection(
-                    name="campus_knowledge"
-                )
-
-            self._initialized = True
-            print(f"✅ RAG engine initialized (collection: {self.collection.count()} docs)")
+            # Initialize ChromaDB with persistent storage (already open if a pinned version was read early)
+            self.client = self.client or chromadb.PersistentClient(path=str(self.db_dir))
+            self._open_active_version()
+            count = self.collection.count() if self.collection else 0
+            print(f"✅ RAG engine initialized (collection v{self.active_version}: {count} docs)")
 
             # Auto-index knowledge base if empty or changed
             self._auto_index()
@@ -72,245 +214,1143 @@ class RAGEngine:
             print(f"❌ RAG init error: {e}")
             self._initialized = False
 
+    def _init_numpy_store(self):
+        """Initialize the memory-mapped NumPy store, exact or quantized (no ChromaDB/HNSW needed)."""
+        if not NUMPY_STORE_AVAILABLE:
+            print("⚠️  RAG disabled — numpy store needs numpy")
+            return
+
+        try:
+            self._open_active_version()
+            count = self.collection.count() if self.collection else 0
+            print(f"✅ RAG engine initialized ({self.store} store v{self.active_version}: {count} docs)")
+
+            self._auto_index()
+
+        except Exception as e:
+            print(f"❌ RAG init error: {e}")
+            self._initialized = False
+
+    def _open_active_version(self):
+        """Follow the registry pointer, then load the embedder and the active snapshot."""
+        registry = self._read_versions()
+        self.active_version = registry["active"]
+        self.pinned = registry["pinned"]
+        self.ab_test = registry["ab_test"]
+
+        # Load embedding model if available (otherwise ChromaDB's default embeddings)
+        self._load_embedding_model()
+        if self.active_version is not None:
+            self.collection, self.embedding_model = self._open_snapshot(self.active_version)
+            self._use_lexical_snapshot(self.active_version, self.collection)
+        self._initialized = True
+
+    def _load_embedding_model(self):
+        if not EMBEDDING_BACKENDS_AVAILABLE:
+            return
+
+        backend = resolve_backend(self.embedding_backend, self.embedding_model_path)
+        print(f"📦 Loading embedding backend ({backend})...")
+        self.embedding_model = load_backend(backend, self.embedding_model_path)
+
+    def _embedder_config(self, model=None) -> Dict:
+        """Identifies the vector space; a change invalidates every stored embedding."""
+        model = model or self.embedding_model
+        if model is None:
+            return {"model": "chroma-default"}
+        return model.fingerprint()
+
+    def _get_or_create_collection(self, name: str):
+        if self.embedding_model:
+            return self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        return self.client.get_or_create_collection(name=name)
+
+    # ---------- versioned snapshots ----------
+
+    def _version_dir(self, version: int) -> Path:
+        return self.index_dir / f"v{version}"
+
+    def _read_versions(self) -> Dict:
+        try:
+            registry = json.loads((self.index_dir / VERSIONS_FILE).read_text())
+        except (OSError, ValueError):
+            registry = {}
+        registry.setdefault("active", None)
+        registry.setdefault("pinned", False)
+        registry.setdefault("ab_test", None)
+        registry.setdefault("versions", {})
+        return registry
+
+    def _write_versions(self, registry: Dict):
+        """Replace the registry in one rename: this is the atomic pointer flip."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        path = self.index_dir / VERSIONS_FILE
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(registry, indent=1))
+        os.replace(tmp_path, path)
+        self._versions_mtime = path.stat().st_mtime_ns
+        self.pinned = registry["pinned"]
+        self.ab_test = registry["ab_test"]
+
+    def _sync_versions(self):
+        """Follow pointer flips, pins and A/B changes made by another worker."""
+        path = self.index_dir / VERSIONS_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._versions_mtime or not self._initialized:
+            return
+
+        registry = self._read_versions()
+        self._versions_mtime = mtime
+        self.pinned = registry["pinned"]
+        self.ab_test = registry["ab_test"]
+        if registry["active"] is not None and registry["active"] != self.active_version:
+            self._activate(registry["active"])
+            print(f"🔀 Switched to index v{self.active_version}")
+
+    def _claim_version(self) -> int:
+        """Reserve the next version number by creating its directory (safe across workers)."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        existing = [int(p.name[1:]) for p in self.index_dir.glob("v*") if p.name[1:].isdigit()]
+        existing += [int(v) for v in self._read_versions()["versions"]]
+        version = max(existing, default=0) + 1
+        while True:
+            try:
+                self._version_dir(version).mkdir()
+                return version
+            except FileExistsError:
+                version += 1
+
+    def _open_snapshot(self, version: int):
+        """Collection and query embedder for one stored version."""
+        if self.store != "chroma":
+            quantization = None if self.store == "numpy" else self.store
+            collection = NumpyVectorStore(self._version_dir(version), quantization=quantization,
+                                          rescore=self.rescore)
+        else:
+            collection = self._get_or_create_collection(f"{COLLECTION_NAME}_v{version}")
+
+        model = self.embedding_model
+        if EMBEDDING_BACKENDS_AVAILABLE and isinstance(model, HashingEmbedder):
+            # Hashing vectors depend on the IDF fitted for that version
+            versioned = HashingEmbedder(model.dim, model.char_ngrams, model.word_ngrams)
+            if versioned.load(self._version_dir(version) / HASHING_IDF_FILE):
+                model = versioned
+        return collection, model
+
+    def _snapshot(self, version: Optional[int] = None):
+        """(collection, embedder, lexical index) serving `version`; None means the active one."""
+        if version is None or version == self.active_version:
+            return self.collection, self.embedding_model, self.lexical_index
+
+        cached = self._snapshots.get(version)
+        if cached is None:
+            if str(version) not in self._read_versions()["versions"]:
+                raise ValueError(f"Unknown index version {version}")
+            collection, model = self._open_snapshot(version)
+            cached = self._snapshots[version] = (collection, model, self._lexical_from_store(collection))
+        return cached
+
+    @staticmethod
+    def _lexical_from_store(collection) -> BM25Index:
+        """BM25 index over the chunks a version actually stores (not the current files)."""
+        stored = collection.get()
+        lexical = BM25Index(partition_key="category")
+        if stored["ids"]:
+            lexical.add(stored["ids"], stored["documents"], stored["metadatas"])
+        return lexical
+
+    def _use_lexical_snapshot(self, version: int, collection):
+        """Make the keyword side serve exactly what `version` serves on the dense side."""
+        manifest = self._load_manifest(version) or {}
+        self.lexical_index = self._lexical_from_store(collection)
+        self._lexical_hash = manifest.get("kb_hash")
+        self._bump_generation()
+
+    def _activate(self, version: int):
+        """Serve `version`: swap in its collection, embedder, keyword index and (if different) chunker."""
+        collection, model = self._open_snapshot(version)
+        chunker = self._read_versions()["versions"].get(str(version), {}).get("chunker")
+        rechunk = bool(chunker) and chunker != self._chunker_config()
+        if rechunk:
+            # Adopt the chunking the version was built with, so incremental updates match it
+            self.chunker = MarkdownChunker(chunk_tokens=chunker["chunk_tokens"],
+                                           overlap_tokens=chunker["overlap_tokens"])
+
+        self.collection, self.embedding_model = collection, model
+        self.active_version = version
+        self._snapshots.pop(version, None)
+        # A rollback must take bad content out of keyword and hybrid results too
+        self._use_lexical_snapshot(version, collection)
+
+    def _begin_build(self, empty: bool) -> Dict:
+        """
+        Claim a new version and return its write target. Queries keep using the
+        active version until _finish_build() flips the pointer.
+
+        - numpy: a private staging copy (empty, or of the active snapshot), committed
+          into the version's own directory
+        - chroma: a new collection, pre-filled with the active collection's records
+          for incremental builds (no re-embedding)
+        """
+        version = self._claim_version()
+        if self.store != "chroma":
+            store, _ = self._open_snapshot(version)
+            if empty or self.collection is None:
+                return {"version": version, "store": store, "target": store.staging(empty=True)}
+            return {"version": version, "store": store, "target": self.collection.staging()}
+
+        collection = self._get_or_create_collection(f"{COLLECTION_NAME}_v{version}")
+        if not empty and self.collection is not None:
+            total = self.collection.count()
+            for offset in range(0, total, MAX_WRITE_BATCH):
+                page = self.collection.get(include=["embeddings", "documents", "metadatas"],
+                                           limit=MAX_WRITE_BATCH, offset=offset)
+                if page["ids"]:
+                    collection.add(ids=page["ids"], embeddings=page["embeddings"],
+                                   documents=page["documents"], metadatas=page["metadatas"])
+        return {"version": version, "store": collection, "target": collection}
+
+    def _finish_build(self, build: Dict, manifest: Dict, model=None, activate: bool = True) -> int:
+        """Persist a finished build, record it and (optionally) flip the active pointer to it."""
+        version = build["version"]
+        if build["target"] is not build["store"]:
+            build["store"].commit(build["target"])
+        self._save_manifest(manifest, version)
+        if EMBEDDING_BACKENDS_AVAILABLE and isinstance(model, HashingEmbedder):
+            model.save(self._version_dir(version) / HASHING_IDF_FILE)
+
+        registry = self._read_versions()
+        registry["versions"][str(version)] = {
+            "created": round(time.time(), 3),
+            "chunker": manifest["chunker"],
+            "embedder": manifest["embedder"].get("model"),
+            "chunks": build["store"].count(),
+        }
+        if activate:
+            registry["active"] = version
+        self._write_versions(registry)
+        if activate:
+            self._activate(version)
+        self._prune_versions()
+        return version
+
+    def _prune_versions(self):
+        """Drop all but the newest `keep_versions` (never the active or A/B version)."""
+        registry = self._read_versions()
+        versions = sorted(int(v) for v in registry["versions"])
+        keep = set(versions[-self.keep_versions:]) if self.keep_versions > 0 else set()
+        keep.add(registry["active"])
+        if registry["ab_test"]:
+            keep.add(registry["ab_test"]["version"])
+        dropped = [v for v in versions if v not in keep]
+        if not dropped:
+            return
+
+        for v in dropped:
+            del registry["versions"][str(v)]
+        self._write_versions(registry)
+        for v in dropped:
+            self._snapshots.pop(v, None)
+            if self.store == "chroma":
+                try:
+                    self.client.delete_collection(f"{COLLECTION_NAME}_v{v}")
+                except Exception:
+                    pass
+            # Open mmaps in other workers stay valid after unlink on POSIX
+            shutil.rmtree(self._version_dir(v), ignore_errors=True)
+
+    def list_versions(self) -> List[Dict]:
+        """Stored index versions, newest first."""
+        registry = self._read_versions()
+        return [
+            {"version": int(v), **info, "active": int(v) == registry["active"]}
+            for v, info in sorted(registry["versions"].items(), key=lambda item: -int(item[0]))
+        ]
+
+    def activate_version(self, version: int, pin: bool = True):
+        """
+        Serve a stored version. With pin=True automatic re-indexing is paused
+        (so the watcher does not rebuild over a rollback) until unpin().
+        """
+        with self._index_lock:
+            registry = self._read_versions()
+            if str(version) not in registry["versions"]:
+                raise ValueError(f"Unknown index version {version}")
+            registry["active"] = version
+            registry["pinned"] = pin
+            if registry["ab_test"] and registry["ab_test"]["version"] == version:
+                registry["ab_test"] = None
+            self._write_versions(registry)
+            self._activate(version)
+        print(f"🔀 Serving index v{version}{' (pinned)' if pin else ''}")
+
+    def rollback(self) -> Optional[int]:
+        """Pin the newest version older than the active one; returns it (None if there is none)."""
+        older = [v["version"] for v in self.list_versions()
+                 if self.active_version is not None and v["version"] < self.active_version]
+        if not older:
+            return None
+        self.activate_version(older[0], pin=True)
+        return older[0]
+
+    def unpin(self):
+        """Resume automatic re-indexing after a rollback."""
+        with self._index_lock:
+            registry = self._read_versions()
+            registry["pinned"] = False
+            self._write_versions(registry)
+        self.refresh()
+
+    def build_version(self, chunk_tokens: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                      activate: bool = False) -> Optional[int]:
+        """
+        Full build with (optionally) different chunking, kept beside the active
+        version for A/B tests unless activate=True. Returns the new version.
+        """
+        if not self.dense_ready:
+            return None
+        chunker = MarkdownChunker(chunk_tokens=chunk_tokens or self.chunker.chunk_tokens,
+                                  overlap_tokens=chunk_overlap or self.chunker.overlap_tokens)
+        with self._index_lock:
+            return self._index_all_documents(chunker=chunker, activate=activate)
+
+    def start_ab_test(self, version: int, share: float = 0.5):
+        """Route `share` of traffic keys (see ab_version) to a stored version."""
+        if not 0 < share < 1:
+            raise ValueError("share must be between 0 and 1")
+        with self._index_lock:
+            registry = self._read_versions()
+            if str(version) not in registry["versions"]:
+                raise ValueError(f"Unknown index version {version}")
+            registry["ab_test"] = {"version": version, "share": share}
+            self._write_versions(registry)
+
+    def stop_ab_test(self):
+        with self._index_lock:
+            registry = self._read_versions()
+            registry["ab_test"] = None
+            self._write_versions(registry)
+
+    def ab_version(self, key: str) -> Optional[int]:
+        """
+        Index version for a traffic key (e.g. student id): the A/B candidate for a
+        stable `share` of keys, None (the active version) for the rest.
+        """
+        test = self.ab_test
+        if not test or test["version"] == self.active_version:
+            return None
+        # md5 rather than crc32: similar keys ("s1", "s2") must land in unrelated buckets
+        bucket = int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16) / 0x100000000
+        return test["version"] if bucket < test["share"] else None
+
     def _auto_index(self):
         """Index knowledge base files if not already indexed or if content changed."""
         if not self._initialized or not self.knowledge_dir.exists():
             return
+        if self.pinned:
+            print(f"📌 Index pinned to v{self.active_version}, skipping re-index")
+            return
 
         # Check if we need to re-index by comparing file hashes
-        current_hash = self._compute_kb_hash()
-        hash_file = self.db_dir / ".kb_hash"
+        file_hashes = self._compute_file_hashes()
+        current_hash = self._compute_kb_hash(file_hashes)
+        manifest = self._load_manifest()
+
+        # A missing manifest, empty store, new chunking parameters or a different
+        # embedder need a full rebuild
+        needs_full = (manifest is None or self.collection is None or self.collection.count() == 0
+                      or manifest.get("chunker") != self._chunker_config()
+                      or manifest.get("embedder") != self._embedder_config())
 
-        if hash_file.exists() and hash_file.read_text().strip() == current_hash:
+        if not needs_full and manifest.get("kb_hash") == current_hash:
             print("📚 Knowledge base unchanged, skipping re-index")
             return
 
-        print("📚 Indexing knowledge base...")
-        self._index_all_documents()
+        if needs_full:
+            print("📚 Indexing knowledge base...")
+            self._index_all_documents(current_hash)
+        else:
+            print("📚 Knowledge base changed, re-indexing modified files...")
+            self._reindex_changed_files(manifest, file_hashes, current_hash)
+
+        self._refresh_lexical_index(current_hash)
+
+    def refresh(self) -> bool:
+        """
+        Re-check the knowledge base and apply any edits without a restart.
+        Runs off the request path (watcher thread); searches keep hitting the
+        current indexes until the rebuilt ones are swapped in.
+
+        Returns:
+            True if an index changed
+        """
+        with self._index_lock:
+            generation = self.generation
+            self._sync_versions()
+            self._auto_index()
+            self._refresh_lexical_index()
+            changed = self.generation != generation
+        if changed:
+            self.watcher_stats["refreshes"] += 1
+            self.watcher_stats["last_refresh"] = time.time()
+        return changed
+
+    def start_watcher(self, interval: Optional[float] = None):
+        """Poll knowledge_dir for edits in a daemon thread and hot-reindex them."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self.watch_interval = interval or self.watch_interval
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch_loop, name="rag-watcher", daemon=True)
+        self._watcher.start()
+        print(f"👀 Watching {self.knowledge_dir} for changes every {self.watch_interval:g}s")
+
+    def stop_watcher(self, timeout: Optional[float] = None):
+        self._watch_stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+            self._watcher = None
+
+    def close(self):
+        """
+        Release threads and cached state (e.g. when a tenant's engine is evicted).
+        Requests still holding the engine keep working: hybrid search runs its
+        dense side inline once the pool is gone.
+        """
+        self.stop_watcher(timeout=2)
+        if self._batcher:
+            self._batcher.close(timeout=2)
+        self._search_pool.shutdown(wait=False)
+        self._snapshots.clear()
+        self._embedding_cache.clear()
+        self._search_cache.clear()
+
+    def _kb_signature(self):
+        """(name, mtime, size) per knowledge file: a stat-only change check, no hashing."""
+        if not self.knowledge_dir.exists():
+            return ()
+        signature = []
+        for f in self._knowledge_files():
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            signature.append((self._file_key(f), st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def _watch_loop(self):
+        signature = self._kb_signature()
+        while not self._watch_stop.wait(self.watch_interval):
+            self.watcher_stats["checks"] += 1
+            with self._index_lock:
+                self._sync_versions()
+            current = self._kb_signature()
+            if current == signature:
+                continue
+            try:
+                if self.refresh():
+                    print("🔄 Knowledge base reloaded")
+                signature = current
+                self.watcher_stats["last_error"] = None
+            except Exception as e:
+                # Retry on the next poll (e.g. a file caught mid-save)
+                print(f"❌ Knowledge base reload failed: {e}")
+                self.watcher_stats["last_error"] = str(e)
+
+    def _init_lexical_index(self):
+        """
+        Keyword index served while the dense side loads: the pinned version's own
+        chunks after a rollback (so loading never brings rolled-back content
+        back), otherwise the knowledge files.
+        """
+        registry = self._read_versions()
+        if registry["pinned"] and registry["active"] is not None:
+            try:
+                if self.store == "chroma" and CHROMADB_AVAILABLE:
+                    self.client = chromadb.PersistentClient(path=str(self.db_dir))
+                    collection = self.client.get_collection(f"{COLLECTION_NAME}_v{registry['active']}")
+                elif self.store != "chroma" and NUMPY_STORE_AVAILABLE:
+                    collection = self._open_snapshot(registry["active"])[0]
+                else:
+                    collection = None
+                if collection is not None:
+                    self._use_lexical_snapshot(registry["active"], collection)
+                    return
+            except Exception as e:
+                print(f"⚠️  Could not read pinned index v{registry['active']}: {e}")
+        self._refresh_lexical_index()
+
+    def _refresh_lexical_index(self, kb_hash: Optional[str] = None):
+        """
+        (Re)build the in-memory BM25 index from the knowledge files when their hash
+        changes. Once a dense version is active the keyword index mirrors that
+        version instead (see _activate), so edits reach it through a new version.
+        """
+        if not self.knowledge_dir.exists():
+            return
+        if self._initialized and self.active_version is not None and self.collection is not None:
+            return
+
+        kb_hash = kb_hash or self._compute_kb_hash()
+        if self.lexical_index is not None and kb_hash == self._lexical_hash:
+            return
+
+        index = BM25Index(partition_key="category")
+        for md_file in self._knowledge_files():
+            index.add(*self._collect_chunks(md_file))
+        manual_ids, manual_docs, manual_metas = self._load_manual_documents()
+        if manual_ids:
+            index.add(manual_ids, manual_docs, manual_metas)
+
+        # Swap in the finished index in one assignment so readers never see a partial build
+        self.lexical_index = index
+        self._lexical_hash = kb_hash
+        self._bump_generation()
+
+    def _bump_generation(self):
+        """Invalidate cached embeddings and search results after an index change."""
+        self.generation += 1
+        self._embedding_cache.clear()
+        self._search_cache.clear()
+
+    def _knowledge_files(self) -> List[Path]:
+        """
+        Markdown files of the knowledge base: top-level files (one category each,
+        named after the file) and files one directory down, whose category is the
+        directory name (e.g. circulars/exam-timetable.md, see document_ingest.py).
+        """
+        if not self.knowledge_dir.exists():
+            return []
+        return sorted([*self.knowledge_dir.glob("*.md"), *self.knowledge_dir.glob("*/*.md")])
+
+    def _file_key(self, path: Path) -> str:
+        """Manifest key: the path relative to knowledge_dir ("fees.md", "circulars/x.md")."""
+        return path.relative_to(self.knowledge_dir).as_posix()
+
+    def _compute_file_hashes(self) -> Dict[str, str]:
+        """Content hash of every knowledge base file, keyed by relative path."""
+        return {self._file_key(f): self._hash_file(f) for f in self._knowledge_files()}
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
 
-        # Save hash
-        self.db_dir.mkdir(parents=True, exist_ok=True)
-        hash_file.write_text(current_hash)
+    def _chunker_config(self, chunker: Optional[MarkdownChunker] = None) -> Dict:
+        """Chunking parameters; a change invalidates every stored chunk."""
+        chunker = chunker or self.chunker
+        return {
+            "chunk_tokens": chunker.chunk_tokens,
+            "overlap_tokens": chunker.overlap_tokens,
+        }
 
-    def _compute_kb_hash(self) -> str:
+    def _compute_kb_hash(self, file_hashes: Optional[Dict[str, str]] = None) -> str:
         """Compute a hash of all knowledge base files for change detection."""
+        if file_hashes is None:
+            file_hashes = self._compute_file_hashes()
         hasher = hashlib.md5()
-        for f in sorted(self.knowledge_dir.glob("*.md")):
-            hasher.update(f.read_bytes())
+        for name in sorted(file_hashes):
+            hasher.update(f"{name}:{file_hashes[name]}".encode())
         return hasher.hexdigest()
 
-    def _index_all_documents(self):
-        """Index all markdown files from knowledge_base directory."""
-        if not self._initialized:
-            return
+    @staticmethod
+    def _chunk_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-        # Clear existing collection
+    def _load_manifest(self, version: Optional[int] = None) -> Optional[Dict]:
+        """Read the per-file/per-chunk hash manifest of a version (default: the active one)."""
+        version = version or self.active_version
+        if version is None:
+            return None
+        manifest_file = self._version_dir(version) / ".kb_manifest.json"
+        if not manifest_file.exists():
+            return None
         try:
-            self.client.delete_collection("campus_knowledge")
-            if self.embedding_model:
-                self.collection = self.client.get_or_create_collection(
-                    name="campus_knowledge",
-                    metadata={"hnsw:space": "cosine"}
-                )
-            else:
-                self.collection = self.client.get_or_create_collection(
-                    name="campus_knowledge"
-                )
-        except Exception:
-            pass
+            return json.loads(manifest_file.read_text())
+        except (OSError, ValueError):
+            return None
 
-        doc_count = 0
-        for md_file in self.knowledge_dir.glob("*.md"):
-            chunks = self._chunk_document(md_file)
+    def _save_manifest(self, manifest: Dict, version: int):
+        self._version_dir(version).mkdir(parents=True, exist_ok=True)
+        (self._version_dir(version) / ".kb_manifest.json").write_text(json.dumps(manifest, indent=1))
+
+    def _load_manual_documents(self):
+        """Chunks added through add_documents, as parallel (ids, documents, metadatas) lists."""
+        try:
+            records = json.loads((self.index_dir / MANUAL_FILE).read_text())
+        except (OSError, ValueError):
+            records = []
+        return ([r["id"] for r in records], [r["text"] for r in records],
+                [r["metadata"] for r in records])
+
+    def _save_manual_documents(self, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Append to the manual chunk sidecar, replacing it in one rename."""
+        known_ids, known_docs, known_metas = self._load_manual_documents()
+        records = [{"id": i, "text": d, "metadata": m}
+                   for i, d, m in zip(known_ids + ids, known_docs + documents, known_metas + metadatas)]
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        path = self.index_dir / MANUAL_FILE
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(records, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    def _iter_file_chunks(self, md_file: Path, chunker: Optional[MarkdownChunker] = None):
+        """Stream (id, document, metadata) triples for one file."""
+        if md_file.parent == self.knowledge_dir:
             category = md_file.stem  # e.g., "documents", "fees", "courses"
+        else:
+            category = md_file.parent.name  # e.g., "circulars"
+        # Ids follow the relative path ("fees_0", "circulars/exam-timetable_0"): "/" never
+        # occurs in a file name, so circulars/x.md and a top-level circulars_x.md stay apart
+        prefix = self._file_key(md_file)[:-len(md_file.suffix)]
+        for i, chunk in enumerate((chunker or self.chunker).iter_file(md_file)):
+            yield f"{prefix}_{i}", chunk["text"], {
+                "source": md_file.name,
+                "category": category,
+                "chunk_index": i,
+                "heading_path": chunk["heading_path"],
+                "content_hash": self._chunk_hash(chunk["text"]),
+            }
 
-            for i, chunk in enumerate(chunks):
-                doc_id = f"{category}_{i}"
-                metadata = {
-                    "source": md_file.name,
-                    "category": category,
-                    "chunk_index": i,
-                }
-
-                if self.embedding_model:
-                    embedding = self.embedding_model.encode(chunk).tolist()
-                    self.collection.add(
-                        ids=[doc_id],
-                        embeddings=[embedding],
-                        documents=[chunk],
-                        metadatas=[metadata],
-                    )
-                else:
-                    self.collection.add(
-                        ids=[doc_id],
-                        documents=[chunk],
-                        metadatas=[metadata],
-                    )
-                doc_count += 1
-
-        print(f"✅ Indexed {doc_count} chunks from {len(list(self.knowledge_dir.glob('*.md')))} files")
-
-    def _chunk_document(self, file_path: Path, chunk_size: int = 500) -> List[str]:
-        """
-        Split a markdown document into chunks by sections.
-        Each section header (##) starts a new chunk.
-        """
-        content = file_path.read_text(encoding="utf-8")
-        chunks = []
-        current_chunk = []
-        current_length = 0
-
-        for line in content.split("\n"):
-            # Start a new chunk on section headers if current chunk is big enough
-            if line.startswith("## ") and current_length > 100:
-                chunks.append("\n".join(current_chunk))
-                current_chunk = [line]
-                current_length = len(line)
+    def _collect_chunks(self, md_file: Path):
+        """Chunk one file into parallel (ids, documents, metadatas) lists."""
+        ids, documents, metadatas = [], [], []
+        for doc_id, text, meta in self._iter_file_chunks(md_file):
+            ids.append(doc_id)
+            documents.append(text)
+            metadatas.append(meta)
+        return ids, documents, metadatas
+
+    def _index_all_documents(self, kb_hash: Optional[str] = None,
+                             chunker: Optional[MarkdownChunker] = None,
+                             activate: bool = True) -> Optional[int]:
+        """
+        Index all markdown files from knowledge_base directory into a new version.
+        Searches keep using the active version until the pointer flips to this one.
+        """
+        if not self._initialized:
+            return None
+
+        build = self._begin_build(empty=True)
+        start = time.perf_counter()
+        md_files = self._knowledge_files()
+        manual_ids, manual_docs, manual_metas = self._load_manual_documents()
+
+        model = self.embedding_model
+        if EMBEDDING_BACKENDS_AVAILABLE and isinstance(model, HashingEmbedder):
+            # IDF is refit on the new corpus and stored with this version
+            model = model.fitted(chain(
+                (text for md_file in md_files for _, text, _ in self._iter_file_chunks(md_file, chunker)),
+                manual_docs,
+            ))
+
+        # Stream chunks from every file and encode/write them MAX_WRITE_BATCH at a time,
+        # so large handbooks never have to be held in memory in full
+        ids, documents, metadatas = [], [], []
+        manifest = {
+            "chunker": self._chunker_config(chunker),
+            "embedder": self._embedder_config(model),
+            "kb_hash": kb_hash or self._compute_kb_hash(),
+            "files": {},
+        }
+        total = 0
+        for md_file in md_files:
+            chunk_hashes = {}
+            for doc_id, text, meta in self._iter_file_chunks(md_file, chunker):
+                ids.append(doc_id)
+                documents.append(text)
+                metadatas.append(meta)
+                chunk_hashes[doc_id] = meta["content_hash"]
+                if len(ids) >= MAX_WRITE_BATCH:
+                    self._write_chunks(ids, documents, metadatas, collection=build["target"], model=model)
+                    total += len(ids)
+                    ids, documents, metadatas = [], [], []
+            manifest["files"][self._file_key(md_file)] = {
+                "hash": self._hash_file(md_file),
+                "chunks": chunk_hashes,
+            }
+
+        self._write_chunks(ids, documents, metadatas, collection=build["target"], model=model)
+        total += len(ids)
+        if manual_ids:
+            self._write_chunks(manual_ids, manual_docs, manual_metas, upsert=True,
+                               collection=build["target"], model=model)
+            total += len(manual_ids)
+        version = self._finish_build(build, manifest, model, activate=activate)
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0.0
+        self.last_index_stats = {
+            "version": version,
+            "chunks": total,
+            "files": len(md_files),
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(rate, 1),
+        }
+        print(f"✅ Indexed {total} chunks from {len(md_files)} files as v{version} "
+              f"in {elapsed:.2f}s ({rate:.1f} chunks/sec)")
+        return version
+
+    def _reindex_changed_files(self, manifest: Dict, file_hashes: Dict[str, str],
+                               kb_hash: Optional[str] = None):
+        """
+        Re-embed only the chunks whose content changed since the last run, into a
+        new version that starts as a copy of the active one.
+        Unchanged files are skipped entirely; within a changed file, chunks whose
+        hash matches the manifest are carried over without re-embedding.
+        """
+        start = time.perf_counter()
+        old_files = manifest.get("files", {})
+        new_files = {}
+        ids, documents, metadatas = [], [], []
+        stale_ids = []
+        changed_files = 0
+
+        for name, file_hash in file_hashes.items():
+            previous = old_files.get(name)
+            if previous and previous.get("hash") == file_hash:
+                new_files[name] = previous
+                continue
+
+            changed_files += 1
+            old_chunks = previous.get("chunks", {}) if previous else {}
+            file_ids, file_docs, file_metas = self._collect_chunks(self.knowledge_dir / name)
+            for cid, doc, meta in zip(file_ids, file_docs, file_metas):
+                if old_chunks.get(cid) != meta["content_hash"]:
+                    ids.append(cid)
+                    documents.append(doc)
+                    metadatas.append(meta)
+            current_ids = set(file_ids)
+            stale_ids += [cid for cid in old_chunks if cid not in current_ids]
+            new_files[name] = {
+                "hash": file_hash,
+                "chunks": {cid: m["content_hash"] for cid, m in zip(file_ids, file_metas)},
+            }
+
+        # Files removed from the knowledge base
+        for name, previous in old_files.items():
+            if name not in file_hashes:
+                changed_files += 1
+                stale_ids += list(previous.get("chunks", {}))
+
+        new_manifest = {
+            "chunker": self._chunker_config(),
+            "embedder": self._embedder_config(),
+            "kb_hash": kb_hash or self._compute_kb_hash(file_hashes),
+            "files": new_files,
+        }
+        if not ids and not stale_ids:
+            # Only file metadata changed (e.g. a touch); no new version needed
+            self._save_manifest(new_manifest, self.active_version)
+            return
+
+        build = self._begin_build(empty=False)
+        reused = self._write_known_chunks(ids, documents, metadatas, build["target"])
+        embed = [i for i in range(len(ids)) if ids[i] not in reused]
+        self._write_chunks([ids[i] for i in embed], [documents[i] for i in embed],
+                           [metadatas[i] for i in embed], upsert=True, collection=build["target"])
+        if stale_ids:
+            build["target"].delete(ids=stale_ids)
+        version = self._finish_build(build, new_manifest, self.embedding_model)
+
+        elapsed = time.perf_counter() - start
+        self.last_index_stats = {
+            "version": version,
+            "chunks": len(ids),
+            "embedded": len(embed),
+            "reused": len(reused),
+            "deleted": len(stale_ids),
+            "files": changed_files,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(len(ids) / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+        print(f"✅ Re-indexed {changed_files} changed files as v{version}: {len(ids)} chunks upserted "
+              f"({len(embed)} embedded, {len(reused)} moved), {len(stale_ids)} removed in {elapsed:.2f}s")
+
+    def _write_known_chunks(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+                            target) -> set:
+        """
+        Upsert the chunks whose content the active version already embedded (e.g.
+        shifted to a new id by a section inserted above them) with their stored
+        vectors. Returns the ids written; the rest still need embedding.
+        """
+        if not ids or self.collection is None:
+            return set()
+        hashes = list({m["content_hash"] for m in metadatas})
+        known = {}
+        for start in range(0, len(hashes), MAX_WRITE_BATCH):
+            stored = self.collection.get(where={"content_hash": {"$in": hashes[start:start + MAX_WRITE_BATCH]}},
+                                         include=["embeddings", "metadatas"])
+            embeddings = stored.get("embeddings")
+            if embeddings is None:
+                continue
+            for meta, embedding in zip(stored["metadatas"], embeddings):
+                known.setdefault(meta.get("content_hash"), embedding)
+
+        rows = [i for i, m in enumerate(metadatas) if m["content_hash"] in known]
+        for start in range(0, len(rows), MAX_WRITE_BATCH):
+            batch = rows[start:start + MAX_WRITE_BATCH]
+            target.upsert(ids=[ids[i] for i in batch],
+                          embeddings=[known[metadatas[i]["content_hash"]] for i in batch],
+                          documents=[documents[i] for i in batch],
+                          metadatas=[metadatas[i] for i in batch])
+        return {ids[i] for i in rows}
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _encode_queries(self, queries: List[str], version: Optional[int] = None,
+                        model=None) -> List[List[float]]:
+        """Embed queries in one batch (shared with concurrent callers), reusing cached vectors."""
+        model = model or self.embedding_model
+        keys = [(self.generation, version, self._normalize_query(q)) for q in queries]
+        embeddings = [self._embedding_cache.get(key) for key in keys]
+
+        missing = [i for i, emb in enumerate(embeddings) if emb is None]
+        if missing:
+            texts = [queries[i] for i in missing]
+            # The batcher encodes with the active embedder; other versions encode inline
+            if self._batcher and model is self.embedding_model:
+                encoded = self._batcher.encode(texts)
             else:
-                current_chunk.append(line)
-                current_length += len(line)
+                encoded = self._embed(texts, model)
+            for i, emb in zip(missing, encoded):
+                embeddings[i] = emb
+                self._embedding_cache.put(keys[i], emb)
+        return embeddings
+
+    def embed_queries(self, queries: List[str], version: Optional[int] = None) -> Optional[List[List[float]]]:
+        """
+        Query vectors from the embedder serving `version`, or None while dense
+        retrieval is unavailable. Vectors are cached, so a search for the same
+        text right after reuses them.
+        """
+        if not self.dense_ready:
+            return None
+        model = self._snapshot(version)[1]
+        if model is None:
+            return None
+        return self._encode_queries(queries, version, model)
 
-                # Also split if chunk gets too large
-                if current_length > chunk_size and not line.startswith("#"):
-                    chunks.append("\n".join(current_chunk))
-                    current_chunk = []
-                    current_length = 0
+    def _embed(self, texts: List[str], model=None) -> List[List[float]]:
+        """Encode a list of texts with batched forward passes."""
+        model = model or self.embedding_model
+        vectors = model.encode(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+        # The numpy stores take arrays directly; skip the list round trip
+        return vectors if self.store != "chroma" else vectors.tolist()
 
-        if current_chunk:
-            chunks.append("\n".join(current_chunk))
+    def _write_chunks(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+                      upsert: bool = False, collection=None, model=None):
+        """Embed and add chunks to the collection, MAX_WRITE_BATCH records per write."""
+        collection = collection if collection is not None else self.collection
+        write = collection.upsert if upsert else collection.add
+        for start in range(0, len(ids), MAX_WRITE_BATCH):
+            end = start + MAX_WRITE_BATCH
+            batch = {
+                "ids": ids[start:end],
+                "documents": documents[start:end],
+                "metadatas": metadatas[start:end],
+            }
+            if model or self.embedding_model:
+                batch["embeddings"] = self._embed(documents[start:end], model)
+            write(**batch)
 
-        # Filter out very short chunks
-        return [c.strip() for c in chunks if len(c.strip()) > 50]
+    def _chunk_document(self, file_path: Path) -> List[str]:
+        """Split a markdown document into token-sized chunks (see chunker.MarkdownChunker)."""
+        return [chunk["text"] for chunk in self.chunker.iter_file(file_path)]
 
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+    def search(self, query: str, top_k: int = 3, mode: Optional[str] = None,
+               category: Optional[str] = None, version: Optional[int] = None) -> List[Dict]:
         """
         Search the knowledge base for relevant content.
 
         Args:
             query: User's question
             top_k: Number of results to return
+            mode: "dense", "keyword" or "hybrid" (defaults to the engine's search_mode)
+            category: Restrict the search to one category partition (e.g. "fees")
+            version: Stored index version to query (defaults to the active one)
+
+        Returns:
+            List of dicts with 'id', 'text', 'category', 'source', 'score' keys
+        """
+        return self.search_many([query], top_k=top_k, mode=mode, category=category, version=version)[0]
+
+    def search_many(self, queries: List[str], top_k: int = 3, mode: Optional[str] = None,
+                    category: Optional[str] = None, version: Optional[int] = None) -> List[List[Dict]]:
+        """
+        Search for several queries at once. Dense retrieval encodes every query
+        in one batch and issues a single collection query for the lot.
 
         Returns:
-            List of dicts with 'text', 'category', 'score' keys
+            One result list per query, in input order
         """
-        if not self._initialized or not self.collection or self.collection.count() == 0:
-            return self._keyword_fallback(query)
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode must be one of {SEARCH_MODES}")
+        if version == self.active_version or not self.dense_ready:
+            version = None  # before the index loads every version is served by BM25
+        if version is not None:
+            self._snapshot(version)  # unknown versions raise before anything is cached
+
+        keys = [(self.generation, version, mode, top_k, category, self._normalize_query(q))
+                for q in queries]
+        output: List[Optional[List[Dict]]] = []
+        for key in keys:
+            cached = self._search_cache.get(key)
+            output.append([dict(r) for r in cached] if cached is not None else None)
+
+        missing = [i for i, results in enumerate(output) if results is None]
+        if not missing:
+            return output
+
+        pending = [queries[i] for i in missing]
+        if mode == "keyword":
+            computed = [self._keyword_fallback(q, top_k, category, version) for q in pending]
+        elif mode == "hybrid":
+            computed = self._hybrid_search_many(pending, top_k, category, version)
+        else:
+            dense = self._dense_search_many(pending, top_k, category, version)
+            computed = [d or self._keyword_fallback(q, top_k, category, version)
+                        for q, d in zip(pending, dense)]
+
+        for i, results in zip(missing, computed):
+            self._search_cache.put(keys[i], [dict(r) for r in results])
+            output[i] = results
+        return output
+
+    def _dense_search_many(self, queries: List[str], top_k: int, category: Optional[str] = None,
+                           version: Optional[int] = None) -> List[List[Dict]]:
+        """Vector search against the collection; empty lists if unavailable."""
+        empty = [[] for _ in queries]
+        if not self.dense_ready:
+            return empty
+        collection, model, _ = self._snapshot(version)
+        if not collection or collection.count() == 0:
+            return empty
 
         try:
-            if self.embedding_model:
-                query_embedding = self.embedding_model.encode(query).tolist()
-                results = self.collection.query(
-                    query_embeddings=[query_embedding],
-                    n_results=min(top_k, self.collection.count()),
+            query_args = {"n_results": min(top_k, collection.count())}
+            if category:
+                # Chroma applies the metadata filter before the vector search;
+                # the numpy store scores only the category's row partition
+                query_args["where"] = {"category": category}
+            if model:
+                results = collection.query(
+                    query_embeddings=self._encode_queries(queries, version, model),
+                    **query_args,
                 )
             else:
-                results = self.collection.query(
-                    query_texts=[query],
-                    n_results=min(top_k, self.collection.count()),
+                results = collection.query(
+                    query_texts=queries,
+                    **query_args,
                 )
 
-            if not results or not results["documents"] or not results["documents"][0]:
-                return self._keyword_fallback(query)
+            if not results or not results["documents"]:
+                return empty
 
             output = []
-            for i, doc in enumerate(results["documents"][0]):
-                meta = results["metadatas"][0][i] if results["metadatas"] else {}
-                distance = results["distances"][0][i] if results.get("distances") else 0
-                score = 1 - distance  # Convert distance to similarity
-
-                output.append({
-                    "text": doc,
-                    "category": meta.get("category", "unknown"),
-                    "source": meta.get("source", ""),
-                    "score": round(score, 3),
-                })
+            for q, docs in enumerate(results["documents"]):
+                hits = []
+                for i, doc in enumerate(docs):
+                    meta = results["metadatas"][q][i] if results["metadatas"] else {}
+                    distance = results["distances"][q][i] if results.get("distances") else 0
+                    score = 1 - distance  # Convert distance to similarity
+
+                    hits.append({
+                        "id": results["ids"][q][i],
+                        "text": doc,
+                        "category": meta.get("category", "unknown"),
+                        "source": meta.get("source", ""),
+                        "score": round(score, 3),
+                    })
+                output.append(hits)
 
             return output
 
         except Exception as e:
             print(f"RAG search error: {e}")
-            return self._keyword_fallback(query)
+            return empty
 
-    def _keyword_fallback(self, query: str) -> List[Dict]:
+    def _hybrid_search_many(self, queries: List[str], top_k: int, category: Optional[str] = None,
+                            version: Optional[int] = None) -> List[List[Dict]]:
         """
-        Simple keyword-based fallback when ChromaDB is not available.
-        Searches raw markdown files for matching content.
+        Run dense and BM25 retrieval concurrently and merge them with reciprocal
+        rank fusion. Exact tokens ("TC", "NCL", "challan") that embed poorly are
+        still surfaced by the lexical side.
         """
-        if not self.knowledge_dir.exists():
+        depth = max(top_k * 3, 10)
+        try:
+            dense_future = self._search_pool.submit(self._dense_search_many, queries, depth, category, version)
+        except RuntimeError:
+            # Pool shut down by close() (tenant evicted) while this request was still in flight
+            dense_future = None
+        lexical = [self._keyword_fallback(q, depth, category, version) for q in queries]
+        dense = (dense_future.result() if dense_future is not None
+                 else self._dense_search_many(queries, depth, category, version))
+        return [self._reciprocal_rank_fusion([d, kw], top_k) for d, kw in zip(dense, lexical)]
+
+    @staticmethod
+    def _reciprocal_rank_fusion(ranked_lists: List[List[Dict]], top_k: int) -> List[Dict]:
+        """
+        Fuse ranked result lists: each result earns 1 / (RRF_K + rank) per list.
+        'score' keeps the best underlying relevance score so thresholds downstream
+        stay meaningful; the fused value is reported as 'rrf_score'.
+        """
+        fused: Dict[str, Dict] = {}
+        for results in ranked_lists:
+            for rank, result in enumerate(results, start=1):
+                key = result.get("id") or result["text"]
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = {**result, "rrf_score": 0.0}
+                else:
+                    entry["score"] = max(entry["score"], result["score"])
+                entry["rrf_score"] += 1.0 / (RRF_K + rank)
+
+        merged = sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:top_k]
+        for r in merged:
+            r["rrf_score"] = round(r["rrf_score"], 5)
+        return merged
+
+    def _keyword_fallback(self, query: str, top_k: int = 3, category: Optional[str] = None,
+                          version: Optional[int] = None) -> List[Dict]:
+        """
+        BM25 keyword search over the in-memory index, used when ChromaDB is not
+        available or dense retrieval returns nothing.
+        """
+        lexical = self._snapshot(version)[2] if version is not None else self.lexical_index
+        if lexical is None:
             return []
+        return lexical.search(query, top_k=top_k, category=category)
 
-        query_lower = query.lower()
-        results = []
-
-        for md_file in self.knowledge_dir.glob("*.md"):
-            content = md_file.read_text(encoding="utf-8")
-            content_lower = content.lower()
-
-            # Score based on keyword matches
-            keywords = query_lower.split()
-            matches = sum(1 for kw in keywords if kw in content_lower)
-
-            if matches > 0:
-                # Extract the most relevant section
-                sections = content.split("\n## ")
-                best_section = ""
-                best_score = 0
-
-                for section in sections:
-                    section_lower = section.lower()
-                    section_matches = sum(1 for kw in keywords if kw in section_lower)
-                    if section_matches > best_score:
-                        best_score = section_matches
-                        best_section = section
-
-                if best_section:
-                    results.append({
-                        "text": best_section[:500],
-                        "category": md_file.stem,
-                        "source": md_file.name,
-                        "score": round(matches / len(keywords), 3),
-                    })
+    def categories(self) -> List[str]:
+        """Category partitions currently present in the knowledge base."""
+        if self.lexical_index is None:
+            return []
+        return sorted(c for c in self.lexical_index.partitions if c)
 
-        # Sort by score, return top results
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results[:3]
+    def index_fingerprint(self, version: Optional[int] = None) -> str:
+        """
+        Identifies the knowledge a search is served from: the index version, the
+        knowledge-base hash it was built from and its chunk count (which catches
+        add_documents). Unlike `generation` it is stable across restarts, so
+        persistent answer caches key on it.
+        """
+        if version is None or version == self.active_version or not self.dense_ready:
+            version, kb_hash, lexical = self.active_version, self._lexical_hash, self.lexical_index
+        else:
+            lexical = self._snapshot(version)[2]
+            kb_hash = (self._load_manifest(version) or {}).get("kb_hash")
+        chunks = len(lexical) if lexical is not None else 0
+        return f"v{version}:{(kb_hash or '')[:16]}:{chunks}"
 
     def add_document(self, text: str, category: str, source: str = "manual") -> bool:
         """Add a single document chunk to the knowledge base."""
-        if not self._initialized:
-            return False
+        return self.add_documents([{"text": text, "category": category, "source": source}])["success"]
+
+    def add_documents(self, items: List[Dict]) -> Dict:
+        """
+        Add many document chunks with one batched encode and one upsert.
 
+        Args:
+            items: Dicts with 'text', 'category' and optional 'source' keys
+
+        Returns:
+            Dict with 'success', 'added' and 'duplicates' counts. Items whose full
+            sha256 content hash is already indexed (or repeated in the batch) are skipped.
+            Added chunks are also kept in MANUAL_FILE, so rebuilds and restarts keep them.
+        """
+        if not self.dense_ready:
+            return {"success": False, "added": 0, "duplicates": 0}
+
+        with self._index_lock:
+            return self._add_documents(items)
+
+    def _add_documents(self, items: List[Dict]) -> Dict:
         try:
-            doc_id = f"{category}_{hashlib.md5(text.encode()).hexdigest()[:8]}"
-            metadata = {"source": source, "category": category}
-
-            if self.embedding_model:
-                embedding = self.embedding_model.encode(text).tolist()
-                self.collection.add(
-                    ids=[doc_id],
-                    embeddings=[embedding],
-                    documents=[text],
-                    metadatas=[metadata],
-                )
-            else:
-                self.collection.add(
-                    ids=[doc_id],
-                    documents=[text],
-                    metadatas=[metadata],
-                )
-            return True
+            ids, documents, metadatas = [], [], []
+            seen = set()
+            duplicates = 0
+            for item in items:
+                text = item.get("text", "").strip()
+                if not text:
+                    continue
+                content_hash = self._chunk_hash(text)
+                if content_hash in seen:
+                    duplicates += 1
+                    continue
+                seen.add(content_hash)
+                category = item.get("category", "general")
+                ids.append(f"{category}_{content_hash}")
+                documents.append(text)
+                metadatas.append({
+                    "source": item.get("source", "manual"),
+                    "category": category,
+                    "content_hash": content_hash,
+                })
+
+            if ids:
+                existing = self.collection.get(where={"content_hash": {"$in": list(seen)}})
+                indexed = {m.get("content_hash") for m in existing.get("metadatas") or []}
+                keep = [i for i, m in enumerate(metadatas) if m["content_hash"] not in indexed]
+                duplicates += len(ids) - len(keep)
+                ids = [ids[i] for i in keep]
+                documents = [documents[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+
+            if ids:
+                self._write_chunks(ids, documents, metadatas, upsert=True)
+                self._save_manual_documents(ids, documents, metadatas)
+                if self.lexical_index is not None:
+                    self.lexical_index.add(ids, documents, metadatas)
+                self._bump_generation()
+
+            return {"success": True, "added": len(ids), "duplicates": duplicates}
         except Exception as e:
-            print(f"Error adding document: {e}")
-            return False
+            print(f"Error adding documents: {e}")
+            return {"success": False, "added": 0, "duplicates": 0}
 
     def get_stats(self) -> Dict:
         """Get RAG engine statistics."""
         return {
             "initialized": self._initialized,
+            "dense_ready": self.dense_ready,
+            "loading": not self._ready.is_set(),
+            "store": self.store,
             "chromadb_available": CHROMADB_AVAILABLE,
             "embeddings_available": EMBEDDINGS_AVAILABLE,
-            "total_documents": self.collection.count() if self._initialized and self.collection else 0,
-            "knowledge_files": len(list(self.knowledge_dir.glob("*.md"))) if self.knowledge_dir.exists() else 0,
+            "embedder": self.embedding_model.name if self.embedding_model else "chroma-default",
+            "total_documents": self.collection.count() if self.dense_ready and self.collection else 0,
+            "knowledge_files": len(self._knowledge_files()),
+            "last_index": self.last_index_stats,
+            "lexical_documents": len(self.lexical_index) if self.lexical_index is not None else 0,
+            "generation": self.generation,
+            "index_version": self.active_version,
+            "pinned": self.pinned,
+            "ab_test": self.ab_test,
+            "watcher": {
+                "running": self._watcher is not None and self._watcher.is_alive(),
+                "interval": self.watch_interval,
+                **self.watcher_stats,
+            },
+            "batcher": self._batcher.stats() if self._batcher else None,
+            "cache": {
+                "query_embeddings": self._embedding_cache.stats(),
+                "search_results": self._search_cache.stats(),
+            },
         }
 
 
@@ -320,6 +1360,7 @@ if __name__ == "__main__":
     print("=" * 50)
 
     engine = RAGEngine()
+    engine.wait_until_ready()
     print(f"\nStats: {engine.get_stats()}")
 
     # Test search
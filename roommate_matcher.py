@@ -1,18 +1,20 @@
 import numpy as np
-import requests
 import json
 from sklearn.metrics.pairwise import cosine_similarity
 from typing import Dict, List, Any, Optional
 
+from ollama_client import OllamaClient, ollama_instance
+
 class RoommateMatcher:
     """
     ML-powered Roommate Matching Engine
     Uses cosine similarity for compatibility and Local LLM for explanations.
     """
     
-    def __init__(self, ollama_url: str = "http://localhost:11434"):
-        self.ollama_url = ollama_url
-        self.model = "gemma3:4b" # Using Gemma 3 for faster explanations
+    def __init__(self, ollama_url: Optional[str] = None):
+        self.llm = OllamaClient(ollama_url) if ollama_url else ollama_instance
+        self.ollama_url = self.llm.base_url
+        self.model = self.llm.model_for("roommate") # Gemma 3 by default for faster explanations
         
         # Weights for different factors (Total should ideally be 1.0/100%)
         # Note: Weights are handled by multiplying features by weight before similarity
@@ -145,19 +147,9 @@ class RoommateMatcher:
         """
         
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {"temperature": 0.7}
-                },
-                timeout=10
-            )
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "").strip()
+            result = self.llm.generate(prompt, caller="roommate", options={"temperature": 0.7},
+                                       model=self.model)
+            return result.get("response", "").strip()
         except:
             pass
             
@@ -0,0 +1,180 @@
+"""
+Semantic Cache — answers to recently asked questions, matched by embedding similarity
+Lets paraphrases ("fee deadline?" / "when do I have to pay fees") reuse one answer
+without a retrieval or LLM round trip
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Cosine similarity a new question needs with a cached one to reuse its answer
+SIMILARITY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))  # per bucket (see SemanticCache)
+TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL", str(6 * 3600)))
+
+# Knowledge-base generations served at once per tenant: the active index and an A/B candidate
+LIVE_GENERATIONS = 2
+
+# Stands in for the asking student's name inside stored answers
+NAME_PLACEHOLDER = "\x00name\x00"
+DEFAULT_NAME = "Student"
+
+
+def _template(answer: str, name: str) -> str:
+    """Swap the asking student's name for the placeholder so the answer can be re-addressed."""
+    if not name or name == DEFAULT_NAME:
+        # "Student" is also an ordinary word; only the greeting is theirs
+        return re.sub(rf"^(\W*\w+ ){DEFAULT_NAME}\b", rf"\g<1>{NAME_PLACEHOLDER}", answer, count=1)
+    return re.sub(rf"\b{re.escape(name)}\b", NAME_PLACEHOLDER, answer)
+
+
+class SemanticCache:
+    """
+    Small in-memory vector index of answered questions.
+
+    Entries live in buckets keyed by (scope, language, cohort, generation): a
+    tenant's answers are only reused for questions in the same language, from
+    students of the same cohort (department and year, which the prompt
+    personalizes on), against the same knowledge-base generation. A tenant
+    keeps the buckets of its LIVE_GENERATIONS most recently used generations,
+    so A/B traffic alternating between two versions does not wipe either. Each
+    bucket keeps its `max_entries` most recent questions as one normalized
+    matrix, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None,
+                 ttl_seconds: Optional[int] = None):
+        self.threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._buckets: Dict[tuple, Dict] = {}
+        self._generations: Dict[str, "OrderedDict[str, None]"] = {}  # scope -> live generations, LRU order
+        self._lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "misses": 0, "writes": 0, "invalidations": 0}
+        self._hit_scores: List[float] = []
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else None
+
+    def lookup(self, vector, name: str = DEFAULT_NAME, scope: str = "default",
+               language: str = "en", generation: str = "", cohort: str = "") -> Optional[Dict]:
+        """
+        The cached entry for the most similar earlier question at or above the
+        threshold, with its answer addressed to `name`; None on a miss.
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._observe(scope, generation)
+            bucket = self._buckets.get((scope, language, cohort, generation))
+            if query is None or bucket is None or not bucket["entries"]:
+                self.stats_counters["misses"] += 1
+                return None
+
+            matrix = self._matrix(bucket)
+            if matrix.shape[1] != query.shape[0]:
+                self.stats_counters["misses"] += 1
+                return None
+            scores = matrix @ query
+            best = int(scores.argmax())
+            key = list(bucket["entries"])[best]
+            entry = bucket["entries"][key]
+            if scores[best] < self.threshold or now - entry["created_at"] > self.ttl_seconds > 0:
+                self.stats_counters["misses"] += 1
+                return None
+
+            bucket["entries"].move_to_end(key)
+            bucket["matrix"] = None
+            self.stats_counters["hits"] += 1
+            self._hit_scores = (self._hit_scores + [float(scores[best])])[-256:]
+            return {
+                "question": entry["question"],
+                "response": entry["answer"].replace(NAME_PLACEHOLDER, name or DEFAULT_NAME),
+                "similarity": round(float(scores[best]), 4),
+                "sources": list(entry["sources"]),
+                "intent": entry["intent"],
+            }
+
+    def add(self, vector, question: str, answer: str, name: str = DEFAULT_NAME,
+            scope: str = "default", language: str = "en", generation: str = "",
+            sources: Optional[List[str]] = None, intent: Optional[str] = None, cohort: str = ""):
+        """Remember the answer to `question` (asked by `name`)."""
+        v = self._normalize(vector)
+        if v is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._observe(scope, generation)
+            bucket = self._buckets.setdefault((scope, language, cohort, generation),
+                                              {"entries": OrderedDict(), "matrix": None})
+            key = " ".join(question.lower().split())
+            bucket["entries"][key] = {
+                "vector": v,
+                "question": question,
+                "answer": _template(answer, name),
+                "sources": list(sources or []),
+                "intent": intent,
+                "created_at": time.time(),
+            }
+            bucket["entries"].move_to_end(key)
+            while len(bucket["entries"]) > self.max_entries:
+                bucket["entries"].popitem(last=False)
+            bucket["matrix"] = None
+            self.stats_counters["writes"] += 1
+
+    @staticmethod
+    def _matrix(bucket: Dict) -> np.ndarray:
+        """Rows in entry order, stacked once per change to the bucket."""
+        if bucket["matrix"] is None:
+            bucket["matrix"] = np.stack([e["vector"] for e in bucket["entries"].values()])
+        return bucket["matrix"]
+
+    def _observe(self, scope: str, generation: str):
+        """Mark `generation` live for `scope`; the least recently used one past LIVE_GENERATIONS is dropped."""
+        live = self._generations.setdefault(scope, OrderedDict())
+        if generation in live:
+            live.move_to_end(generation)
+            return
+        live[generation] = None
+        while len(live) > LIVE_GENERATIONS:
+            self._invalidate(scope, live.popitem(last=False)[0])
+
+    def _invalidate(self, scope: Optional[str], generation: Optional[str] = None):
+        stale = [key for key in self._buckets
+                 if (scope is None or key[0] == scope) and (generation is None or key[3] == generation)]
+        for key in stale:
+            self.stats_counters["invalidations"] += len(self._buckets.pop(key)["entries"])
+
+    def clear(self, scope: Optional[str] = None):
+        """Forget every answer (of `scope`, if given)."""
+        with self._lock:
+            if scope is None:
+                self._generations.clear()
+            else:
+                self._generations.pop(scope, None)
+            self._invalidate(scope)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            entries = sum(len(b["entries"]) for b in self._buckets.values())
+            buckets = len(self._buckets)
+            hit_scores = list(self._hit_scores)
+        total = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "buckets": buckets,
+            "threshold": self.threshold,
+            "max_entries": self.max_entries,
+            **counters,
+            "hit_rate": round(counters["hits"] / total, 3) if total else 0.0,
+            "avg_hit_similarity": round(sum(hit_scores) / len(hit_scores), 4) if hit_scores else None,
+        }
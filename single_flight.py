@@ -0,0 +1,116 @@
+"""
+Single Flight — coalesces identical concurrent calls into one upstream call
+The first caller for a key runs it; callers arriving while it is in flight wait and share its result
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Per-key in-flight call registry, safe for threads and event loops.
+
+    - do(key, fn, ...): threads. The leader runs fn; followers block until it
+      finishes and get the same result (or the same exception).
+    - ado(key, coro_fn, ...): async routes. Followers await the leader's task
+      instead of blocking the loop.
+    - begin()/finish(): for callers that produce the result themselves, e.g.
+      while streaming it, and only want others to wait for it.
+
+    Nothing is cached: once a call finishes, the next caller starts a new one.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {"calls": 0, "leaders": 0, "coalesced": 0, "errors": 0}
+
+    def begin(self, key: Hashable) -> Tuple[_Call, bool]:
+        """Join the flight for `key`; True means this caller leads it and must finish() it."""
+        with self._lock:
+            self.stats_counters["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats_counters["coalesced"] += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self.stats_counters["leaders"] += 1
+            return call, True
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: Optional[BaseException] = None):
+        """Publish the leader's outcome to every follower and close the flight."""
+        call.result, call.error = result, error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if error is not None:
+                self.stats_counters["errors"] += 1
+        call.done.set()
+
+    @staticmethod
+    def wait(call: _Call, timeout: Optional[float] = None) -> Any:
+        """A follower's view of the leader's outcome."""
+        if not call.done.wait(timeout):
+            raise TimeoutError("coalesced call did not finish in time")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call)
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result
+
+    async def ado(self, key: Hashable, coro_fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        # Futures belong to one event loop, so async flights are tracked per loop
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            self.stats_counters["calls"] += 1
+            task = self._tasks.get(task_key)
+            if task is not None:
+                self.stats_counters["coalesced"] += 1
+            else:
+                self.stats_counters["leaders"] += 1
+                task = self._tasks[task_key] = asyncio.ensure_future(coro_fn(*args, **kwargs))
+                task.add_done_callback(lambda t: self._task_done(task_key, t))
+        # shield: one cancelled (disconnected) caller must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _task_done(self, task_key: Tuple[int, Hashable], task: asyncio.Future):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+            if not task.cancelled() and task.exception() is not None:
+                self.stats_counters["errors"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            in_flight = len(self._calls) + len(self._tasks)
+        return {
+            "in_flight": in_flight,
+            **counters,
+            "coalesced_rate": round(counters["coalesced"] / counters["calls"], 3) if counters["calls"] else 0.0,
+        }
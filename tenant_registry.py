@@ -0,0 +1,184 @@
+"""
+Tenant Registry — per-campus knowledge bases and indexes for one deployment
+Loads a tenant's RAGEngine on first use and evicts the least recently used ones
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from rag_engine import RAGEngine
+
+# Tenant ids double as directory names
+TENANT_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+DEFAULT_TENANT = "tcet"
+
+
+class UnknownTenantError(KeyError):
+    """No knowledge base exists for the requested tenant."""
+
+
+class TenantRegistry:
+    """
+    Maps tenant ids to RAGEngines.
+
+    - The default tenant uses the existing knowledge_base/ and chroma_db/ paths
+      and is never evicted.
+    - Every other tenant lives in `<tenants_dir>/<tenant_id>/`, with its markdown
+      under knowledge_base/ and its index under index/.
+    - Engines are created on first request and at most `max_loaded` stay
+      resident; the least recently used one is closed when another tenant loads.
+      Embedding models are shared between engines, so a tenant costs its own
+      index and BM25 postings only.
+    - `engine_kwargs` go to every RAGEngine; without them the store and
+      embedder come from RAG_STORE and RAG_EMBEDDING_BACKEND.
+    """
+
+    def __init__(self, tenants_dir: Optional[str] = None, max_loaded: Optional[int] = None,
+                 default_tenant: Optional[str] = None, default_knowledge_dir: str = "knowledge_base",
+                 default_db_dir: str = "chroma_db", watch: bool = False, **engine_kwargs):
+        self.tenants_dir = Path(tenants_dir or os.getenv("RAG_TENANTS_DIR", "tenants"))
+        self.max_loaded = max_loaded or int(os.getenv("RAG_MAX_TENANTS", "4"))
+        self.default_tenant = default_tenant or os.getenv("RAG_DEFAULT_TENANT", DEFAULT_TENANT)
+        self.default_knowledge_dir = default_knowledge_dir
+        self.default_db_dir = default_db_dir
+        self.watch = watch
+        self.engine_kwargs = engine_kwargs
+
+        self._engines: "OrderedDict[str, RAGEngine]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}  # tenant -> lock held while its engine is built
+        self.stats = {"loads": 0, "evictions": 0}
+
+    def _paths(self, tenant_id: str):
+        if tenant_id == self.default_tenant:
+            return Path(self.default_knowledge_dir), Path(self.default_db_dir)
+        root = self.tenants_dir / tenant_id
+        return root / "knowledge_base", root / "index"
+
+    def exists(self, tenant_id: str) -> bool:
+        if tenant_id == self.default_tenant:
+            return True
+        return bool(TENANT_ID_PATTERN.match(tenant_id)) and self._paths(tenant_id)[0].is_dir()
+
+    def tenants(self) -> List[str]:
+        """Every tenant with a knowledge base, loaded or not."""
+        found = {self.default_tenant}
+        if self.tenants_dir.exists():
+            found.update(p.name for p in self.tenants_dir.iterdir()
+                         if TENANT_ID_PATTERN.match(p.name) and (p / "knowledge_base").is_dir())
+        return sorted(found)
+
+    def get(self, tenant_id: Optional[str] = None) -> RAGEngine:
+        """The tenant's engine, loading it (and evicting the LRU tenant) if needed."""
+        tenant_id = (tenant_id or self.default_tenant).lower()
+        if not self.exists(tenant_id):
+            raise UnknownTenantError(tenant_id)
+
+        with self._lock:
+            engine = self._engines.get(tenant_id)
+            if engine is not None:
+                self._touch(tenant_id)
+                return engine
+            load_lock = self._loading.setdefault(tenant_id, threading.Lock())
+
+        # Building an engine chunks and indexes a knowledge base, so only requests
+        # for this tenant wait on it; other tenants and stats keep being served
+        with load_lock:
+            with self._lock:
+                engine = self._engines.get(tenant_id)
+                if engine is not None:
+                    self._touch(tenant_id)
+                    return engine
+
+            knowledge_dir, db_dir = self._paths(tenant_id)
+            engine = RAGEngine(knowledge_dir=str(knowledge_dir), db_dir=str(db_dir), **self.engine_kwargs)
+            if self.watch:
+                engine.start_watcher()
+
+            with self._lock:
+                self._engines[tenant_id] = engine
+                self._loading.pop(tenant_id, None)
+                self.stats["loads"] += 1
+                print(f"🏫 Loaded knowledge base for tenant '{tenant_id}'")
+                evicted = self._evict_over_capacity()
+                self._touch(tenant_id)
+
+        # Closing joins threads, so it happens outside the lock
+        for tid, old in evicted:
+            old.close()
+            print(f"💤 Evicted idle tenant '{tid}'")
+        return engine
+
+    def _touch(self, tenant_id: str):
+        """Mark a resident tenant most recently used; called with the lock held."""
+        self._engines.move_to_end(tenant_id)
+        self._last_used[tenant_id] = time.time()
+
+    def _evict_over_capacity(self) -> List[tuple]:
+        evicted = []
+        for tid in list(self._engines):
+            if len(self._engines) <= self.max_loaded:
+                break
+            if tid == self.default_tenant:
+                continue
+            evicted.append((tid, self._engines.pop(tid)))
+            self._last_used.pop(tid, None)
+            self.stats["evictions"] += 1
+        return evicted
+
+    def evict(self, tenant_id: str) -> bool:
+        """Unload one tenant now (the default tenant stays)."""
+        with self._lock:
+            if tenant_id == self.default_tenant or tenant_id not in self._engines:
+                return False
+            engine = self._engines.pop(tenant_id)
+            self._last_used.pop(tenant_id, None)
+            self.stats["evictions"] += 1
+        engine.close()
+        return True
+
+    def loaded(self) -> List[str]:
+        """Resident tenants, least recently used first."""
+        with self._lock:
+            return list(self._engines)
+
+    def start_watchers(self):
+        """Watch the knowledge bases of resident tenants and of every tenant loaded later."""
+        self.watch = True
+        with self._lock:
+            engines = list(self._engines.values())
+        for engine in engines:
+            engine.start_watcher()
+
+    def close(self):
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+            self._last_used.clear()
+        for engine in engines:
+            engine.close()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            loaded = {
+                tid: {
+                    "documents": engine.get_stats()["total_documents"],
+                    "index_version": engine.active_version,
+                    "idle_seconds": round(time.time() - self._last_used[tid], 1),
+                }
+                for tid, engine in self._engines.items()
+            }
+        return {
+            "default": self.default_tenant,
+            "max_loaded": self.max_loaded,
+            "known": self.tenants(),
+            "loaded": loaded,
+            **self.stats,
+        }
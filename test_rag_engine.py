@@ -0,0 +1,795 @@
+from bm25_index import BM25Index, tokenize
+from chunker import MarkdownChunker, count_tokens
+from document_ingest import html_to_markdown, ingest
+from embedding_batcher import EmbeddingBatcher
+from embeddings import HashingEmbedder
+from llm_cache import ResponseCache
+from quantization import Int8Quantizer, ProductQuantizer
+from semantic_cache import SemanticCache
+from single_flight import SingleFlight
+from rag_engine import RAGEngine
+from tenant_registry import TenantRegistry, UnknownTenantError
+from vector_store import NumpyVectorStore
+
+
+def test_bm25_ranking():
+    index = BM25Index(partition_key="category")
+    index.add(
+        ["fees_0", "documents_0", "hostel_0"],
+        [
+            "Fee payment deadline is within 15 days. Pay by bank challan or Razorpay.",
+            "Upload your TC (Transfer Certificate) and NCL certificate before verification.",
+            "Hostel rules: curfew at 10 PM, mess timings and warden contact.",
+        ],
+        [{"category": "fees"}, {"category": "documents"}, {"category": "hostel"}],
+    )
+
+    print("--- 🧪 Testing BM25 keyword index ---")
+    assert tokenize("What documents do I need?") == ["documents"]
+
+    results = index.search("challan", top_k=3)
+    assert [r["id"] for r in results] == ["fees_0"]
+    assert results[0]["score"] == 1.0
+
+    assert index.search("TC", top_k=1)[0]["category"] == "documents"
+    assert index.search("rules", category="fees") == []
+    assert index.search("rules", category="hostel")[0]["id"] == "hostel_0"
+    assert sorted(index.partitions) == ["documents", "fees", "hostel"]
+
+    # Replacing a document drops its old terms
+    index.add(["fees_0"], ["Refund policy for cancelled admissions."], [{"category": "fees"}])
+    assert index.search("challan") == []
+    assert len(index) == 3
+    assert len(index.partitions["fees"]) == 1
+    print("✅ BM25 ranking, category partitions and replacement OK")
+
+
+def test_hybrid_fusion(tmp_path, monkeypatch):
+    dense = [{"id": "fees_0", "text": "Fee deadline", "score": 0.82},
+             {"id": "hostel_0", "text": "Hostel curfew", "score": 0.41}]
+    lexical = [{"id": "documents_0", "text": "Submit your TC", "score": 1.0},
+               {"id": "hostel_0", "text": "Hostel curfew", "score": 0.6}]
+
+    print("--- 🧪 Testing reciprocal rank fusion ---")
+    fused = RAGEngine._reciprocal_rank_fusion([dense, lexical], top_k=3)
+    # Found by both retrievers beats first place in one; ties keep first-seen order
+    assert [r["id"] for r in fused] == ["hostel_0", "fees_0", "documents_0"]
+    assert fused[0]["rrf_score"] == round(2 / 62, 5) and fused[1]["rrf_score"] == round(1 / 61, 5)
+    # 'score' stays the best underlying relevance score, not the fused value
+    assert [r["score"] for r in fused] == [0.6, 0.82, 1.0]
+    assert len(RAGEngine._reciprocal_rank_fusion([dense, lexical], top_k=1)) == 1
+
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "documents.md").write_text("# Documents\n\nSubmit the TC at the admission office.\n")
+    (kb / "hostel.md").write_text("# Hostel\n\nCurfew is at 10 PM.\n")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    # An exact token the embedder misses is still surfaced by the BM25 side
+    hostel = engine.search("Curfew", mode="dense", top_k=1)
+    monkeypatch.setattr(engine, "_dense_search_many", lambda queries, *args: [hostel for _ in queries])
+    assert not any("TC" in r["text"] for r in engine.search("Where do I submit my TC?", mode="dense"))
+    results = engine.search("Where do I submit my TC?", mode="hybrid")
+    tc = [r for r in results if "TC" in r["text"]]
+    assert len(tc) == 1 and tc[0]["rrf_score"] == round(1 / 61, 5) and 0 < tc[0]["score"] <= 1
+    engine.close()
+    print("✅ Hybrid search surfaces the BM25-only 'TC' match")
+
+
+def test_markdown_chunker():
+    chunker = MarkdownChunker(chunk_tokens=40, overlap_tokens=10)
+    lines = [
+        "# Fees",
+        "## Deadlines",
+        "Pay within 15 days. " * 12,
+        "## Refunds",
+        "Short.",
+    ]
+    chunks = list(chunker.iter_lines(lines))
+
+    print("--- 🧪 Testing streaming markdown chunker ---")
+    assert all(count_tokens(c["text"]) <= 40 for c in chunks)
+    assert all(c["text"].startswith("## ") for c in chunks)
+    assert chunks[0]["heading_path"] == "Fees > Deadlines"
+    # Short sections are kept, not filtered out
+    assert chunks[-1] == {"text": "## Refunds\nShort.", "heading_path": "Fees > Refunds"}
+    # Split sections share overlapping sentences
+    assert chunks[0]["text"].splitlines()[-1] == chunks[1]["text"].splitlines()[1]
+    print(f"✅ {len(chunks)} chunks within budget with heading paths and overlap")
+
+
+def test_numpy_store_staging(tmp_path):
+    store = NumpyVectorStore(tmp_path / "store")
+    store.upsert(["fees_0"], [[1.0, 0.0]], ["Fee deadline"], [{"category": "fees"}])
+
+    print("--- 🧪 Testing numpy store staged rebuild ---")
+    staging = store.staging(empty=True)
+    staging.add(["hostel_0"], [[0.0, 1.0]], ["Hostel curfew"], [{"category": "hostel"}])
+    # Readers keep the old snapshot until the staged build is committed
+    assert store.get()["ids"] == ["fees_0"]
+    store.commit(staging)
+    assert store.get()["ids"] == ["hostel_0"]
+    assert store.query([[0.0, 1.0]], n_results=1)["ids"] == [["hostel_0"]]
+    print("✅ Staged writes become visible in a single commit")
+
+
+def test_numpy_store_concurrent_reads(tmp_path):
+    import threading
+    import numpy as np
+
+    rng = np.random.default_rng(1)
+    store = NumpyVectorStore(tmp_path / "store", quantization="int8")
+    store.upsert(["c0"], rng.normal(size=(1, 16)), ["doc c0"], [{"category": "x"}])
+
+    print("--- 🧪 Testing numpy store reads during writes ---")
+    errors = []
+    done = threading.Event()
+
+    def read():
+        queries = np.random.default_rng(2)
+        while not done.is_set():
+            try:
+                result = store.query(queries.normal(size=(1, 16)), n_results=5, where={"category": "x"})
+                # Ids, documents and vectors always come from the same snapshot
+                assert all(doc == f"doc {i}" for i, doc in zip(result["ids"][0], result["documents"][0]))
+            except Exception as e:
+                errors.append(e)
+                return
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for n in range(1, 40):
+        store.upsert([f"c{n}"], rng.normal(size=(1, 16)), [f"doc c{n}"], [{"category": "x"}])
+        if n % 3 == 0:
+            store.delete([f"c{n - 2}"])
+    done.set()
+    reader.join()
+    assert not errors, errors
+    print("✅ Queries never mix rows from two snapshots")
+
+
+def test_quantized_scoring(tmp_path):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(300, 32)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = corpus[:5]
+    exact = queries @ corpus.T
+
+    print("--- 🧪 Testing int8 / PQ asymmetric scoring ---")
+    for quantizer in (Int8Quantizer(), ProductQuantizer(subspaces=8, centroids=64)):
+        quantizer.fit(corpus)
+        approx = quantizer.score(queries, quantizer.encode(corpus))
+        assert approx.shape == exact.shape
+        # Each query's own row stays among its top candidates
+        top = np.argsort(-approx, axis=1)[:, :10]
+        assert all(i in top[i] for i in range(len(queries)))
+        print(f"✅ {quantizer.name}: mean abs error {np.abs(approx - exact).mean():.4f}")
+
+    # A write fits a fresh quantizer: the scales serving in-flight queries never change under them
+    store = NumpyVectorStore(tmp_path / "int8", quantization="int8")
+    store.upsert([f"c{i}" for i in range(100)], corpus[:100], ["chunk"] * 100, [{"category": "x"}] * 100)
+    quantizer, codes = store._state.quantized
+    state = quantizer.state().copy()
+    store.upsert([f"c{i}" for i in range(100, 300)], corpus[100:], ["chunk"] * 200, [{"category": "x"}] * 200)
+    assert np.array_equal(quantizer.state(), state) and store._state.quantized[0] is not quantizer
+    assert store.query(queries[:1], n_results=1)["ids"] == [["c0"]]
+
+
+def test_hashing_embedder():
+    corpus = [
+        "Fee payment deadline is within 15 days of admission.",
+        "Hostel curfew is at 10 PM; contact the warden for late entry.",
+        "Upload the Transfer Certificate before document verification.",
+    ]
+    embedder = HashingEmbedder(dim=1024).fit(corpus)
+    vectors = embedder.encode(corpus)
+    query = embedder.encode(["when are fees due"])[0]
+
+    print("--- 🧪 Testing hashing-vectorizer embeddings ---")
+    assert vectors.shape == (3, 1024)
+    assert abs(float((vectors[0] ** 2).sum()) - 1.0) < 1e-5
+    # Char n-grams match "fees" to "Fee"; the hash is stable across processes
+    assert int((vectors @ query).argmax()) == 0
+    assert embedder.fingerprint() == HashingEmbedder(dim=1024).fit(corpus).fingerprint()
+    print("✅ Hashing embedder ranks the fee chunk first")
+
+
+def test_onnx_backend(tmp_path):
+    import numpy as np
+    import pytest
+
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    tokenizers = pytest.importorskip("tokenizers")
+    from onnx import TensorProto, helper
+    from embeddings import EmbeddingBackend, OnnxBackend
+
+    # Tokenizer over a tiny vocabulary; [PAD] is id 0
+    vocab = {"[PAD]": 0, "[UNK]": 1, "fee": 2, "deadline": 3, "hostel": 4, "curfew": 5}
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+
+    # "Transformer" that looks each token up in a table; the pad row is non-zero,
+    # so pooling that ignored the attention mask would show
+    table = np.arange(len(vocab) * 4, dtype=np.float32).reshape(len(vocab), 4) % 7 + 1
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["token_embeddings"])],
+        "lookup",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "tokens"]),
+         helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "tokens"])],
+        [helper.make_tensor_value_info("token_embeddings", TensorProto.FLOAT, ["batch", "tokens", 4])],
+        [helper.make_tensor("table", TensorProto.FLOAT, table.shape, table.ravel())],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model.onnx"))
+
+    print("--- 🧪 Testing ONNX embedding backend ---")
+    try:
+        EmbeddingBackend()
+        assert False, "EmbeddingBackend is abstract"
+    except TypeError:
+        pass
+
+    backend = OnnxBackend(str(tmp_path), threads=1)
+    texts = ["hostel curfew fee deadline", "fee", "deadline fee"]
+    vectors = backend.encode(texts, batch_size=2)
+
+    # Mean of the real tokens' rows (padding excluded), L2-normalized, in input order
+    ids = [[vocab[w] for w in text.split()] for text in texts]
+    expected = np.stack([table[row].mean(axis=0) for row in ids])
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    assert vectors.shape == (3, 4) and vectors.dtype == np.float32
+    assert np.allclose(vectors, expected, atol=1e-6)
+    assert np.allclose(backend.encode("fee"), expected[1:2], atol=1e-6)
+    assert backend.fingerprint()["file"] == "model.onnx"
+    print("✅ ONNX backend mean-pools real tokens and normalizes")
+
+
+def test_embedding_batcher():
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        return [[len(t)] for t in texts]
+
+    batcher = EmbeddingBatcher(encode, max_batch=64, max_wait_ms=50)
+    queries = [["a" * i] for i in range(1, 21)]
+
+    print("--- 🧪 Testing embedding micro-batcher ---")
+    with ThreadPoolExecutor(20) as pool:
+        results = list(pool.map(batcher.encode, queries))
+    batcher.close()
+
+    # Every caller gets its own rows back, from far fewer encode calls
+    assert results == [[[i]] for i in range(1, 21)]
+    assert sum(calls) == 20 and len(calls) < 20
+
+    # After close, late requests encode inline instead of starting a new worker thread
+    threads = threading.active_count()
+    assert batcher.encode(["late"]) == [[4]]
+    assert threading.active_count() == threads and batcher._worker is None
+
+    # Requests a stuck worker never reached fail on close instead of waiting forever
+    release = threading.Event()
+    stuck = EmbeddingBatcher(lambda texts: release.wait() and [[0]] * len(texts), max_wait_ms=0)
+    first = stuck.submit(["a"])
+    while not first.running():
+        time.sleep(0.01)
+    queued = stuck.submit(["b"])
+    stuck.close(timeout=0.1)
+    try:
+        queued.result(1)
+        assert False, "requests left behind by close() must fail"
+    except RuntimeError:
+        pass
+    release.set()
+    assert first.result(1) == [[0]]
+    print(f"✅ 20 concurrent requests served by {len(calls)} batched encodes")
+
+
+def test_index_versions(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    fees = kb / "fees.md"
+    fees.write_text("# Fees\n\nThe tuition fee deadline is 15 August.\n")
+    (kb / "hostel.md").write_text("# Hostel\n\nHostel gates close at 10 pm.\n")
+
+    print("--- 🧪 Testing versioned index snapshots ---")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    assert engine.active_version == 1
+
+    fees.write_text(fees.read_text() + "\n## Late fee\n\nA late fee of 500 applies after the deadline.\n")
+    assert engine.refresh() and engine.active_version == 2
+
+    # A candidate built beside the active version is queryable without serving it
+    candidate = engine.build_version(chunk_tokens=40)
+    assert candidate == 3 and engine.active_version == 2
+    assert engine.search("late fee", mode="keyword", version=candidate)[0]["category"] == "fees"
+
+    engine.start_ab_test(candidate, share=0.5)
+    routed = {engine.ab_version(f"student_{i}") for i in range(50)}
+    assert routed == {None, candidate}
+    engine.stop_ab_test()
+
+    # Rollback pins the previous version; the watcher/refresh must not rebuild over it
+    assert engine.rollback() == 1 and engine.pinned
+    fees.write_text(fees.read_text() + "\nPay online.\n")
+    engine.refresh()
+    assert engine.active_version == 1
+
+    engine.unpin()
+    assert engine.active_version == 4 and not engine.pinned
+    print(f"✅ Versions {[v['version'] for v in engine.list_versions()]}, serving v{engine.active_version}")
+
+
+def test_incremental_reindex(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    fees = kb / "fees.md"
+    fees.write_text("# Fees\n\n## Deadline\n\nThe tuition fee deadline is 15 August.\n\n"
+                    "## Late fee\n\nA late fee of Rs 500 applies after the deadline.\n\n"
+                    "## Refunds\n\nRefunds are processed within 30 days of withdrawal.\n")
+    (kb / "hostel.md").write_text("# Hostel\n\nCurfew is at 10 PM.\n")
+    (kb / "exams.md").write_text("# Exams\n\nSemester exams start on 2 December.\n")
+
+    print("--- 🧪 Testing incremental re-index ---")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    assert sorted(engine.collection.get()["ids"]) == ["exams_0", "fees_0", "fees_1", "fees_2", "hostel_0"]
+
+    # Count what the encoder serving the active version is asked to embed
+    encoded = []
+
+    def count_encodes():
+        model = engine.embedding_model
+        encode = model.encode
+        model.encode = lambda texts, **kwargs: encoded.extend(texts) or encode(texts, **kwargs)
+
+    count_encodes()
+
+    # One chunk edited, one removed, one file deleted, one file untouched
+    fees.write_text("# Fees\n\n## Deadline\n\nThe tuition fee deadline is 15 August.\n\n"
+                    "## Late fee\n\nA late fee of Rs 1000 applies after the deadline.\n")
+    (kb / "exams.md").unlink()
+    assert engine.refresh()
+
+    assert encoded == ["## Late fee\nA late fee of Rs 1000 applies after the deadline."]
+    stored = engine.collection.get()
+    assert sorted(stored["ids"]) == ["fees_0", "fees_1", "hostel_0"]
+    assert "Rs 1000" in stored["documents"][stored["ids"].index("fees_1")]
+    assert engine.last_index_stats["chunks"] == 1 and engine.last_index_stats["deleted"] == 2
+    assert "Rs 1000" in engine.search("late fee amount", mode="dense")[0]["text"]
+
+    # A section inserted at the top shifts every id below it, but only the new text is embedded
+    encoded.clear()
+    count_encodes()
+    fees.write_text("# Fees\n\n## Scholarships\n\nMerit scholarships cover half the tuition fee.\n\n"
+                    + fees.read_text().split("\n\n", 1)[1])
+    assert engine.refresh()
+    assert encoded == ["## Scholarships\nMerit scholarships cover half the tuition fee."]
+    assert engine.last_index_stats["reused"] == 2
+    stored = engine.collection.get(ids=["fees_2"])
+    assert "Rs 1000" in stored["documents"][0]
+    assert "Rs 1000" in engine.search("late fee amount", mode="dense")[0]["text"]
+    engine.close()
+    print(f"✅ Re-embedded {len(encoded)} chunk, removed {engine.last_index_stats['deleted']}")
+
+
+def test_chunk_ids_follow_file_paths(tmp_path):
+    kb = tmp_path / "kb"
+    (kb / "circulars").mkdir(parents=True)
+    (kb / "circulars" / "exam.md").write_text("# Exam\n\nSemester exams start on 2 December.\n")
+    (kb / "circulars_exam.md").write_text("# Exam fees\n\nThe exam fee is Rs 1200.\n")
+
+    print("--- 🧪 Testing chunk ids of nested files ---")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    assert sorted(engine.collection.get()["ids"]) == ["circulars/exam_0", "circulars_exam_0"]
+
+    # Deleting one file removes its chunks only
+    (kb / "circulars" / "exam.md").unlink()
+    engine.refresh()
+    stored = engine.collection.get()
+    assert stored["ids"] == ["circulars_exam_0"] and "Rs 1200" in stored["documents"][0]
+    engine.close()
+    print("✅ circulars/exam.md and circulars_exam.md keep separate chunks")
+
+
+def test_rollback_restores_keyword_index(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    fees = kb / "fees.md"
+    fees.write_text("# Fees\n\nThe tuition fee deadline is 15 August.\n")
+
+    print("--- 🧪 Testing rollback of the keyword index ---")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    fees.write_text(fees.read_text() + "\n## Waiver\n\nAll fees are waived for everyone forever.\n")
+    engine.refresh()
+    assert "waived" in engine.search("fees waived forever", mode="keyword")[0]["text"]
+
+    # Rolled-back content must leave keyword and hybrid results, not just dense ones
+    assert engine.rollback() == 1
+    for mode in ("keyword", "hybrid"):
+        results = engine.search("fees waived forever", mode=mode)
+        assert results and not any("waived" in r["text"] for r in results), mode
+    assert engine.index_fingerprint().startswith("v1:")
+
+    # A restart while pinned serves the pinned version's chunks from the start
+    engine.close()
+    reloaded = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                         background=True, embedding_backend="hashing", batch_wait_ms=0)
+    assert not any("waived" in r["text"] for r in reloaded.search("fees waived forever", mode="keyword"))
+    reloaded.wait_until_ready()
+    reloaded.close()
+    print("✅ Rollback removed the bad chunk from keyword and hybrid search")
+
+
+def test_manual_documents_survive_rebuilds(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "fees.md").write_text("# Fees\n\nThe tuition fee deadline is 15 August.\n")
+    notice = {"text": "Convocation gowns are collected from the Gymkhana office.", "category": "events"}
+
+    print("--- 🧪 Testing manually added knowledge ---")
+    engine = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                       background=False, embedding_backend="hashing", batch_wait_ms=0)
+    assert engine.add_documents([notice]) == {"success": True, "added": 1, "duplicates": 0}
+
+    # A full rebuild re-embeds the files and keeps the announcement
+    engine.build_version(chunk_tokens=96, activate=True)
+    for mode in ("dense", "keyword"):
+        assert "Gymkhana" in engine.search("convocation gowns gymkhana", mode=mode)[0]["text"], mode
+    engine.close()
+
+    # So does a restart, both while loading (keyword only) and after a chunker change
+    reloaded = RAGEngine(knowledge_dir=str(kb), db_dir=str(tmp_path / "db"), store="numpy",
+                         background=True, embedding_backend="hashing", batch_wait_ms=0, chunk_tokens=64)
+    assert "Gymkhana" in reloaded.search("convocation gowns gymkhana", mode="keyword")[0]["text"]
+    reloaded.wait_until_ready()
+    assert reloaded.active_version == 3
+    assert "Gymkhana" in reloaded.search("convocation gowns gymkhana", mode="dense")[0]["text"]
+    assert reloaded.add_documents([notice])["duplicates"] == 1
+    reloaded.close()
+    print("✅ Manual announcement kept across a rebuild and a restart")
+
+
+def test_tenant_registry(tmp_path):
+    for tenant in ("tcet", "abc", "xyz"):
+        kb = tmp_path / "tenants" / tenant / "knowledge_base"
+        kb.mkdir(parents=True)
+        (kb / "fees.md").write_text(f"# Fees\n\nThe {tenant} tuition fee deadline is 1 July.\n")
+
+    print("--- 🧪 Testing tenant registry ---")
+    registry = TenantRegistry(tenants_dir=str(tmp_path / "tenants"), max_loaded=2,
+                              default_knowledge_dir=str(tmp_path / "tenants" / "tcet" / "knowledge_base"),
+                              default_db_dir=str(tmp_path / "db"), store="numpy",
+                              embedding_backend="hashing", background=False, batch_wait_ms=0)
+
+    # Each tenant answers from its own knowledge base
+    for tenant in ("abc", "xyz"):
+        assert tenant in registry.get(tenant).search("fee deadline", mode="keyword")[0]["text"]
+
+    # The default tenant is never evicted; the least recently used tenant is
+    abc = registry.get("abc")
+    registry.get("xyz")
+    registry.get()
+    assert registry.loaded() == ["xyz", "tcet"]
+    assert registry.stats["evictions"] == 1
+
+    # A request still holding the evicted engine finishes its search
+    assert "abc" in abc.search("fee deadline", mode="hybrid")[0]["text"]
+
+    try:
+        registry.get("../xyz")
+        assert False, "path-like tenant ids must be rejected"
+    except UnknownTenantError:
+        pass
+    registry.close()
+    print(f"✅ {registry.stats['loads']} loads, {registry.stats['evictions']} eviction")
+
+
+def test_tenant_load_does_not_block_others(tmp_path, monkeypatch):
+    import threading
+    import time
+    import tenant_registry
+
+    for tenant in ("tcet", "abc", "xyz"):
+        (tmp_path / "tenants" / tenant / "knowledge_base").mkdir(parents=True)
+
+    release = threading.Event()
+    built = []
+
+    class SlowEngine:
+        def __init__(self, knowledge_dir, **kwargs):
+            built.append(knowledge_dir)
+            if "abc" in knowledge_dir:
+                release.wait(5)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(tenant_registry, "RAGEngine", SlowEngine)
+    registry = TenantRegistry(tenants_dir=str(tmp_path / "tenants"), max_loaded=3,
+                              default_knowledge_dir=str(tmp_path / "tenants" / "tcet" / "knowledge_base"))
+
+    print("--- 🧪 Testing concurrent tenant loads ---")
+    loaders = [threading.Thread(target=registry.get, args=("abc",)) for _ in range(2)]
+    for loader in loaders:
+        loader.start()
+    while not built:
+        time.sleep(0.01)
+
+    # While abc's engine is being built, other tenants load and are served
+    assert isinstance(registry.get("xyz"), SlowEngine)
+    assert registry.loaded() == ["xyz"]
+    release.set()
+    for loader in loaders:
+        loader.join(5)
+    # Both requests for abc share one engine
+    assert sum("abc" in path for path in built) == 1 and registry.stats["loads"] == 2
+    print("✅ A slow tenant load only holds up requests for that tenant")
+
+
+def test_document_ingest(tmp_path):
+    html = ("<html><head><title>Notice</title><script>track()</script></head><body>"
+            "<h1>Exam Notice</h1><p>Exams start on 2 December.</p><h2>Fees</h2>"
+            "<ul><li>Late fee: Rs 500</li></ul></body></html>")
+
+    print("--- 🧪 Testing circular ingestion ---")
+    assert html_to_markdown(html) == "# Exam Notice\n\nExams start on 2 December.\n\n## Fees\n\n- Late fee: Rs 500"
+
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "Exam Notice.html").write_text(html)
+    (src / "bus.txt").write_text("Buses leave at 8 am.")
+    kb = tmp_path / "kb"
+
+    report = ingest([str(src)], str(kb), workers=2)
+    assert report["converted"] == 2 and not report["failed"]
+    assert (kb / "circulars" / "exam-notice.md").exists()
+    assert (kb / "circulars" / "bus.md").read_text().startswith("# bus\n")
+
+    # Unchanged sources are not parsed again
+    assert ingest([str(src)], str(kb), workers=2)["unchanged"] == 2
+    print(f"✅ {report['converted']} documents converted at {report['files_per_sec']} files/sec")
+
+
+def test_response_cache(tmp_path):
+    db = str(tmp_path / "llm_cache.db")
+    cache = ResponseCache(db_path=db, max_entries=10, memory_entries=2)
+    key = ResponseCache.make_key("gemma3:4b", "system", "When are fees due?", {"temperature": 0.3})
+
+    print("--- 🧪 Testing LLM response cache ---")
+    assert key != ResponseCache.make_key("gemma3:4b", "system", "When are fees due?", {"temperature": 0.5})
+    assert cache.get(key, "tcet", "v1") is None
+    cache.put(key, "By 15 August.", "tcet", "v1")
+    assert cache.get(key, "tcet", "v1") == "By 15 August."
+
+    # Answers survive a restart and are only served for their knowledge-base generation
+    cache.close()
+    cache = ResponseCache(db_path=db, max_entries=10, memory_entries=2)
+    assert cache.get(key, "tcet", "v1") == "By 15 August."
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get(key, "tcet", "v2") is None
+
+    # A/B traffic alternating between two generations keeps both; a third drops the older
+    cache.put(key, "By 20 August.", "tcet", "v2")
+    for _ in range(2):
+        assert cache.get(key, "tcet", "v1") == "By 15 August."
+        assert cache.get(key, "tcet", "v2") == "By 20 August."
+    assert cache.get(key, "tcet", "v3") is None
+    assert cache.stats()["disk_entries"] == 1
+    assert cache.get(key, "tcet", "v2") == "By 20 August."
+
+    # Past the size bound the least recently used rows go first
+    for i in range(12):
+        cache.put(f"k{i}", f"answer {i}", "tcet", "v2")
+    assert cache.stats()["disk_entries"] <= 10
+    assert cache.get("k11", "tcet", "v2") == "answer 11" and cache.get("k0", "tcet", "v2") is None
+    cache.close()
+    print(f"✅ Response cache: {cache.stats()['hits']} hits, {cache.stats()['evictions']} evictions")
+
+
+def test_semantic_cache():
+    cache = SemanticCache(threshold=0.9)
+    cache.add([1.0, 0.1, 0.0], "fee deadline?", "Hi Priya! Fees are due by 15 August, Priya.",
+              name="Priya", scope="tcet", language="en", generation="v1", sources=["fees"])
+
+    print("--- 🧪 Testing semantic answer cache ---")
+    hit = cache.lookup([0.9, 0.15, 0.0], name="Rahul", scope="tcet", language="en", generation="v1")
+    assert hit["response"] == "Hi Rahul! Fees are due by 15 August, Rahul."
+    assert hit["sources"] == ["fees"] and hit["similarity"] >= 0.9
+
+    # Unrelated questions, other languages and other KB generations miss
+    assert cache.lookup([0.0, 1.0, 0.0], scope="tcet", language="en", generation="v1") is None
+    assert cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="hi", generation="v1") is None
+    assert cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="en", generation="v1", cohort="Mechanical") is None
+    assert cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="en", generation="v2") is None
+
+    # Both sides of an A/B test keep their answers; a third generation drops the older
+    cache.add([1.0, 0.1, 0.0], "fee deadline?", "Hi Priya! Fees are due by 20 August.",
+              name="Priya", scope="tcet", language="en", generation="v2")
+    for _ in range(2):
+        assert "15 August" in cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="en", generation="v1")["response"]
+        assert "20 August" in cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="en", generation="v2")["response"]
+    assert cache.lookup([1.0, 0.1, 0.0], scope="tcet", language="en", generation="v3") is None
+    assert cache.stats()["entries"] == 1
+    print(f"✅ Paraphrase served at similarity {hit['similarity']}")
+
+
+def _stub_agent(tmp_path, monkeypatch, llm):
+    """LocalLLMAgent over a small numpy/hashing knowledge base in tmp_path, with `llm` for Ollama."""
+    from llm_agent import LocalLLMAgent
+
+    kb = tmp_path / "knowledge_base"
+    kb.mkdir()
+    (kb / "fees.md").write_text("# Fees\n\nThe fee payment deadline is 15 August. Pay online or by challan.\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAG_STORE", "numpy")
+    monkeypatch.setenv("RAG_EMBEDDING_BACKEND", "hashing")
+
+    agent = LocalLLMAgent()
+    agent.rag.wait_until_ready()
+    agent.llm = llm
+    agent.response_cache = ResponseCache(db_path="")
+    return agent
+
+
+def test_semantic_cache_keeps_escalation(tmp_path, monkeypatch):
+    class StubLLM:
+        def generate(self, prompt, **kwargs):
+            return {"response": "Hi Student! Fees are due by 15 August."}
+
+    agent = _stub_agent(tmp_path, monkeypatch, StubLLM())
+    agent.semantic_cache = SemanticCache(threshold=0.3)
+
+    print("--- 🧪 Testing semantic cache vs escalation ---")
+    assert not agent.chat("What is the fee payment deadline?", "s1")["cached"]
+    assert agent.chat("When is the fee payment deadline?", "s2")["cached"]
+
+    # Answers are personalized by department and year, and follow-ups by the conversation
+    mechanical = {"name": "Asha", "department": "Mechanical"}
+    assert not agent.chat("When is the fee payment deadline?", "s4", context=mechanical)["cached"]
+    assert not agent.chat("When is the fee payment deadline?", "s2")["cached"]
+
+    # A paraphrase carrying a complaint still goes to human support
+    result = agent.chat("What is the fee payment deadline? my payment is stuck", "s3")
+    assert result["admin_escalation"] and not result.get("cached")
+    agent.tenants.close()
+    print("✅ Complaints escalate instead of reusing a cached answer")
+
+
+def test_chat_stream(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    class StubLLM:
+        def __init__(self):
+            self.streams = 0
+
+        def stream_generate(self, prompt, **kwargs):
+            self.streams += 1
+            for token in ("Fees ", "are due ", "by 15 August."):
+                yield {"response": token, "done": False}
+            yield {"response": "", "done": True}
+
+    llm = StubLLM()
+    agent = _stub_agent(tmp_path, monkeypatch, llm)
+    agent.semantic_cache = SemanticCache(max_entries=0)
+
+    print("--- 🧪 Testing streamed chat ---")
+    events = []
+    for event in agent.chat_stream("When is the fee payment deadline?", "s1"):
+        events.append(event)
+        if event["event"] == "token":
+            # The answer reaches the session only once the stream has ended
+            assert [m["role"] for m in agent.sessions.get_history("s1")] == ["user"]
+    assert [e["event"] for e in events] == ["token"] * 3 + ["done"]
+    assert events[-1]["response"] == "Fees are due by 15 August." and events[-1]["ttft"] is not None
+    assert agent.sessions.get_history("s1")[-1]["content"] == "Fees are due by 15 August."
+
+    # A client disconnecting mid-stream releases requests waiting on the same answer
+    leader = agent.chat_stream("How do I pay the fee, online or by challan?", "s2")
+    assert next(leader)["event"] == "token"
+    coalesced = agent.inflight.stats()["coalesced"]
+    waiter_events = []
+    waiter = threading.Thread(target=lambda: waiter_events.extend(
+        agent.chat_stream("How do I pay the fee, online or by challan?", "s3")), daemon=True)
+    waiter.start()
+    deadline = time.time() + 5
+    while agent.inflight.stats()["coalesced"] == coalesced and time.time() < deadline:
+        time.sleep(0.01)
+    leader.close()
+    waiter.join(5)
+
+    assert not waiter.is_alive() and llm.streams == 2
+    assert waiter_events[-1]["response"] == agent._fallback_response(waiter_events[-1]["intent"], "en")
+    assert [m["role"] for m in agent.sessions.get_history("s2")] == ["user"]
+    assert agent.inflight.stats()["errors"] == 1 and agent.inflight.stats()["in_flight"] == 0
+    agent.tenants.close()
+    print("✅ Tokens stream before done; a dropped stream releases its waiters")
+
+
+def test_single_flight():
+    import asyncio
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    flights = SingleFlight()
+    calls = []
+
+    def generate(prompt):
+        calls.append(prompt)
+        time.sleep(0.2)
+        return f"answer to {prompt}"
+
+    print("--- 🧪 Testing single-flight coalescing ---")
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: flights.do("fees", generate, "fees"), range(10)))
+    assert results == ["answer to fees"] * 10 and calls == ["fees"]
+
+    # Followers see the leader's failure instead of hanging
+    call, leader = flights.begin("quiz")
+    assert leader
+    waiter = ThreadPoolExecutor(1).submit(lambda: flights.do("quiz", generate, "quiz"))
+    flights.finish("quiz", call, error=TimeoutError("ollama timed out"))
+    try:
+        waiter.result(timeout=2)
+        assert False, "the leader's error must reach followers"
+    except TimeoutError:
+        pass
+
+    async def burst():
+        async def summary():
+            calls.append("summary")
+            await asyncio.sleep(0.1)
+            return "good match"
+        return await asyncio.gather(*(flights.ado("summary", summary) for _ in range(5)))
+
+    assert asyncio.run(burst()) == ["good match"] * 5 and calls.count("summary") == 1
+    assert flights.stats()["in_flight"] == 0
+    print(f"✅ {flights.stats()['coalesced']} of {flights.stats()['calls']} calls coalesced")
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    test_bm25_ranking()
+    test_markdown_chunker()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_numpy_store_concurrent_reads(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_quantized_scoring(Path(tmp))
+    test_hashing_embedder()
+    test_embedding_batcher()
+    test_semantic_cache()
+    test_single_flight()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_numpy_store_staging(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_index_versions(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_incremental_reindex(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_chunk_ids_follow_file_paths(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_rollback_restores_keyword_index(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_manual_documents_survive_rebuilds(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_document_ingest(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_tenant_registry(Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_response_cache(Path(tmp))
@@ -0,0 +1,361 @@
+"""
+Vector Store — Chroma-free, memory-mapped NumPy store for knowledge base chunks
+Embeddings live in a float16 .npy matrix that uvicorn workers share read-only via the page cache
+"""
+
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from quantization import make_quantizer
+
+
+def _normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class _Snapshot(NamedTuple):
+    """One loaded (matrix, metadata) pair; replaced whole, never modified."""
+    ids: List[str]
+    documents: List[str]
+    metadatas: List[Dict]
+    id_to_row: Dict[str, int]
+    category_rows: Dict[str, np.ndarray]
+    matrix: Optional[np.ndarray]
+    quantized: Optional[Tuple]  # (quantizer, codes) fitted together
+
+
+_EMPTY = _Snapshot([], [], [], {}, {}, None, None)
+
+
+class NumpyVectorStore:
+    """
+    Cosine search over an L2-normalized float16 matrix: exact by default, or over
+    int8 / product-quantized codes with float rescoring of the top candidates.
+
+    Implements the subset of the ChromaDB collection API that RAGEngine uses
+    (count, add, upsert, delete, get, query) so the engine can swap stores freely.
+
+    On disk:
+        metadata.json          ids, documents, metadatas and the active matrix file name
+        embeddings-<token>.npy float16 matrix, one row per id
+        codes-<token>.npy      quantized rows (int8 or PQ codes), when quantization is set
+        codebook-<token>.npy   int8 scales or PQ centroids for those codes
+
+    With quantization, queries only read the small code matrix; the float16 rows are
+    touched (through the mmap) only for the `rescore * n_results` candidates.
+    Writes produce a new matrix file and then atomically replace metadata.json,
+    so readers in other processes always see a consistent (matrix, metadata) pair.
+    In-process, a load publishes everything as one _Snapshot in a single
+    assignment, and each read works from the snapshot it started with.
+    staging()/commit() batch any number of writes into a single snapshot.
+    """
+
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, path: str, quantization: Optional[str] = None, rescore: int = 10):
+        """
+        Args:
+            quantization: None (exact float search), "int8" or "pq"
+            rescore: candidates per requested result re-ranked with float vectors;
+                     0 returns the approximate ranking as-is
+        """
+        self.path = Path(path)
+        self.quantization = quantization
+        self.rescore = rescore
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._state = _EMPTY
+        self._loaded_mtime: Optional[int] = None
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _metadata_path(self) -> Path:
+        return self.path / self.METADATA_FILE
+
+    def _load(self):
+        meta_path = self._metadata_path()
+        if not meta_path.exists():
+            return
+
+        mtime = meta_path.stat().st_mtime_ns
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        matrix_file = self.path / meta["embeddings_file"] if meta.get("embeddings_file") else None
+
+        ids = meta["ids"]
+        quantized = None
+        if self.quantization and meta.get("codes_file") and ids:
+            # A fresh quantizer per snapshot: the one serving queries is never refit
+            quantizer = make_quantizer(self.quantization)
+            quantizer.load(np.load(self.path / meta["codebook_file"]))
+            quantized = (quantizer, np.load(self.path / meta["codes_file"], mmap_mode="r"))
+        self._state = _Snapshot(
+            ids=ids,
+            documents=meta["documents"],
+            metadatas=meta["metadatas"],
+            id_to_row={doc_id: i for i, doc_id in enumerate(ids)},
+            category_rows=self._build_partitions(meta["metadatas"]),
+            matrix=np.load(matrix_file, mmap_mode="r") if matrix_file and ids else None,
+            quantized=quantized,
+        )
+        self._loaded_mtime = mtime
+
+    @staticmethod
+    def _build_partitions(metadatas: List[Dict]) -> Dict[str, np.ndarray]:
+        """Row indexes per category, so filtered queries only score their partition."""
+        rows: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            rows.setdefault(meta.get("category"), []).append(i)
+        return {category: np.asarray(r, dtype=np.int64) for category, r in rows.items()}
+
+    @staticmethod
+    def _matches(meta: Dict, where: Dict) -> bool:
+        """Chroma-style metadata filter: equality or {"$in": [...]} per key."""
+        for key, condition in where.items():
+            if isinstance(condition, dict) and "$in" in condition:
+                if meta.get(key) not in condition["$in"]:
+                    return False
+            elif meta.get(key) != condition:
+                return False
+        return True
+
+    def _rows_matching(self, state: _Snapshot, where: Dict) -> np.ndarray:
+        if set(where) == {"category"} and not isinstance(where["category"], dict):
+            return state.category_rows.get(where["category"], np.zeros(0, dtype=np.int64))
+        return np.asarray([
+            i for i, meta in enumerate(state.metadatas) if self._matches(meta, where)
+        ], dtype=np.int64)
+
+    def _maybe_reload(self) -> _Snapshot:
+        """Pick up a snapshot written by another worker; returns the one to read from."""
+        meta_path = self._metadata_path()
+        if meta_path.exists() and meta_path.stat().st_mtime_ns != self._loaded_mtime:
+            with self._lock:
+                if meta_path.stat().st_mtime_ns != self._loaded_mtime:
+                    self._load()
+        return self._state
+
+    def _persist(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+                 matrix: Optional[np.ndarray]):
+        file_keys = ("embeddings_file", "codes_file", "codebook_file")
+        meta_path = self._metadata_path()
+        old_files = {}
+        if meta_path.exists():
+            old_meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            old_files = {key: old_meta.get(key) for key in file_keys}
+
+        files = dict.fromkeys(file_keys)
+        if matrix is not None and len(ids):
+            token = uuid.uuid4().hex[:12]
+            files["embeddings_file"] = f"embeddings-{token}.npy"
+            np.save(self.path / files["embeddings_file"], matrix.astype(np.float16))
+            if self.quantization:
+                # Codes are retrained on every snapshot so they track the corpus; a fresh
+                # quantizer leaves the one serving queries untouched until _load() swaps
+                rows = np.asarray(matrix, dtype=np.float32)
+                quantizer = make_quantizer(self.quantization)
+                quantizer.fit(rows)
+                files["codes_file"] = f"codes-{token}.npy"
+                files["codebook_file"] = f"codebook-{token}.npy"
+                np.save(self.path / files["codes_file"], quantizer.encode(rows))
+                np.save(self.path / files["codebook_file"], quantizer.state())
+
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps({
+            **files,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+        }), encoding="utf-8")
+        os.replace(tmp_path, meta_path)
+
+        # Open mmaps in other workers stay valid after unlink on POSIX
+        for old_file in old_files.values():
+            if old_file and old_file not in files.values():
+                try:
+                    (self.path / old_file).unlink()
+                except OSError:
+                    pass
+
+        self._load()
+
+    # ---------- collection API ----------
+
+    def count(self) -> int:
+        return len(self._maybe_reload().ids)
+
+    def staging(self, empty: bool = False) -> "NumpyStaging":
+        """
+        Private working copy for batched writes; nothing is visible to readers
+        until commit(). empty=True starts from no records (full rebuilds).
+        """
+        with self._lock:
+            state = self._maybe_reload()
+            if empty or state.matrix is None:
+                return NumpyStaging()
+            return NumpyStaging(state.ids, state.documents, state.metadatas,
+                                np.array(state.matrix, dtype=np.float32))
+
+    def commit(self, staging: "NumpyStaging"):
+        """Publish a staging copy as the new snapshot in one metadata swap."""
+        with self._lock:
+            self._persist(staging.ids, staging.documents, staging.metadatas, staging.matrix)
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        if not ids:
+            return
+        with self._lock:
+            staging = self.staging()
+            staging.upsert(ids, embeddings, documents, metadatas)
+            self.commit(staging)
+
+    add = upsert
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            state = self._maybe_reload()
+            if not any(i in state.id_to_row for i in ids):
+                return
+            staging = self.staging()
+            staging.delete(ids)
+            self.commit(staging)
+
+    def reset(self):
+        """Remove every record (equivalent of deleting and recreating a collection)."""
+        with self._lock:
+            self._persist([], [], [], None)
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            include: Optional[List[str]] = None) -> Dict:
+        state = self._maybe_reload()
+        rows = range(len(state.ids)) if ids is None else [
+            state.id_to_row[i] for i in ids if i in state.id_to_row
+        ]
+        if where:
+            rows = [r for r in rows if self._matches(state.metadatas[r], where)]
+        result = {
+            "ids": [state.ids[r] for r in rows],
+            "documents": [state.documents[r] for r in rows],
+            "metadatas": [state.metadatas[r] for r in rows],
+        }
+        if include and "embeddings" in include:
+            result["embeddings"] = [state.matrix[r].astype(np.float32).tolist() for r in rows]
+        return result
+
+    def query(self, query_embeddings, n_results: int = 3, where: Optional[Dict] = None) -> Dict:
+        """
+        Cosine top-k: one matrix product plus argpartition per query.
+        `where` takes equality filters; {"category": ...} uses the prebuilt partitions.
+
+        Quantized stores score the codes asymmetrically (float query vs. codes),
+        then re-rank `rescore * n_results` candidates against the float16 rows.
+        """
+        state = self._maybe_reload()
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if state.matrix is None:
+            return result
+
+        queries = _normalize(query_embeddings)
+        rows = self._rows_matching(state, where) if where else None
+        n = len(rows) if rows is not None else len(state.ids)
+        k = min(n_results, n)
+        if k == 0:
+            return {key: [[] for _ in queries] for key in result}
+
+        quantized = state.quantized
+        rescore = quantized is not None and self.rescore > 0
+        if quantized is not None:
+            quantizer, codes = quantized
+            codes = codes[rows] if rows is not None else codes
+            scores = quantizer.score(queries, codes)
+            depth = min(k * self.rescore, n) if rescore else k
+        else:
+            matrix = state.matrix[rows] if rows is not None else state.matrix
+            columns = np.flatnonzero(queries.any(axis=0))
+            if len(columns) < queries.shape[1] // 4:
+                # Sparse queries (hashing embedder): only the touched columns contribute
+                scores = queries[:, columns] @ np.asarray(matrix[:, columns], dtype=np.float32).T
+            else:
+                scores = queries @ matrix.T.astype(np.float32)
+            depth = k
+
+        for query, row_scores in zip(queries, scores):
+            top = np.argpartition(-row_scores, depth - 1)[:depth]
+            candidates = rows[top] if rows is not None else top
+            similarities = row_scores[top]
+            if rescore:
+                similarities = np.asarray(state.matrix[candidates], dtype=np.float32) @ query
+            order = np.argsort(-similarities)[:k]
+            hits = candidates[order]
+            result["ids"].append([state.ids[r] for r in hits])
+            result["documents"].append([state.documents[r] for r in hits])
+            result["metadatas"].append([state.metadatas[r] for r in hits])
+            result["distances"].append([float(1 - similarities[i]) for i in order])
+
+        return result
+
+
+class NumpyStaging:
+    """
+    In-memory (ids, documents, metadatas, matrix) working set behind
+    NumpyVectorStore.staging(). Supports the same write calls as the store.
+    """
+
+    def __init__(self, ids: Optional[List[str]] = None, documents: Optional[List[str]] = None,
+                 metadatas: Optional[List[Dict]] = None, matrix: Optional[np.ndarray] = None):
+        self.ids: List[str] = list(ids or [])
+        self.documents: List[str] = list(documents or [])
+        self.metadatas: List[Dict] = list(metadatas or [])
+        self.matrix = matrix
+        self._id_to_row = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        if not ids:
+            return
+        new_rows = _normalize(embeddings)
+        if self.matrix is None:
+            self.matrix = np.zeros((0, new_rows.shape[1]), dtype=np.float32)
+
+        appended = []
+        for i, doc_id in enumerate(ids):
+            row = self._id_to_row.get(doc_id)
+            if row is None:
+                appended.append(i)
+                self._id_to_row[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.documents.append(documents[i])
+                self.metadatas.append(metadatas[i])
+            else:
+                self.matrix[row] = new_rows[i]
+                self.documents[row] = documents[i]
+                self.metadatas[row] = metadatas[i]
+
+        if appended:
+            self.matrix = np.vstack([self.matrix, new_rows[appended]])
+
+    add = upsert
+
+    def delete(self, ids: List[str]):
+        drop = {self._id_to_row[i] for i in ids if i in self._id_to_row}
+        if not drop:
+            return
+        keep = [row for row in range(len(self.ids)) if row not in drop]
+        self.ids = [self.ids[r] for r in keep]
+        self.documents = [self.documents[r] for r in keep]
+        self.metadatas = [self.metadatas[r] for r in keep]
+        self.matrix = self.matrix[keep] if self.matrix is not None else None
+        self._id_to_row = {doc_id: i for i, doc_id in enumerate(self.ids)}